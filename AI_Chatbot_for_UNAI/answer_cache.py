@@ -0,0 +1,261 @@
+"""
+AI Chatbot for UNAI - Answer Cache
+แคชคำตอบของคำถามที่ถูกถามซ้ำ ใช้ได้ทั้งเว็บ (chat_page.py) และ CLI (chat.py)
+และรวมคำถามเดียวกันที่เข้ามาพร้อมกันให้เรียก Assistant ครั้งเดียว (SingleFlight)
+"""
+
+import contextvars
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+# ============================================================
+# Configuration
+# ============================================================
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '1000'))
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', '3600'))       # วินาที
+CORPUS_VERSION_TTL = int(os.getenv('CORPUS_VERSION_TTL', '300'))    # วินาที
+CORPUS_VERSION_ERROR_TTL = int(os.getenv('CORPUS_VERSION_ERROR_TTL', '30'))  # วินาที (หลังเช็คไม่สำเร็จ)
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_TIMEOUT', '120'))  # วินาที
+
+_ZERO_WIDTH = re.compile('[\u200b\u200c\u200d\u2060\ufeff]')
+_WHITESPACE = re.compile(r'\s+')
+# ช่องว่างระหว่างตัวอักษรไทย เช่น "ลา ป่วย" กับ "ลาป่วย" ถือว่าเป็นคำถามเดียวกัน
+_THAI_GAP = re.compile(r'(?<=[\u0e00-\u0e7f]) (?=[\u0e00-\u0e7f])')
+_TRAILING_PUNCT = '?？!！.。 '
+
+# ============================================================
+# Functions
+# ============================================================
+
+def normalize_prompt(prompt: str) -> str:
+    """ทำให้คำถามที่ต่างกันแค่ตัวพิมพ์/ช่องว่าง/เครื่องหมายท้ายประโยค กลายเป็นข้อความเดียวกัน"""
+    text = unicodedata.normalize('NFKC', prompt)
+    text = _ZERO_WIDTH.sub('', text)
+    text = text.casefold()
+    text = _WHITESPACE.sub(' ', text).strip()
+    text = _THAI_GAP.sub('', text)
+    return text.rstrip(_TRAILING_PUNCT)
+
+_corpus_versions = {}
+_corpus_lock = threading.Lock()
+
+def get_corpus_version(assistant) -> Optional[str]:
+    """
+    เวอร์ชันของชุดเอกสารใน Assistant (hash ของ id/updated_on ของทุกไฟล์)
+    เมื่อมีการ upload/ลบเอกสาร เวอร์ชันจะเปลี่ยน ทำให้แคชเดิมใช้ไม่ได้
+    ตั้งค่า CORPUS_VERSION ใน .env เพื่อกำหนดเองได้
+    คืน None ถ้ายังไม่เคยเช็คสำเร็จ (ไม่ควรใช้แคชคำตอบ)
+    """
+    override = os.getenv('CORPUS_VERSION')
+    if override:
+        return override
+
+    name = getattr(assistant, 'name', '')
+    now = time.monotonic()
+    with _corpus_lock:
+        cached = _corpus_versions.get(name)    # (เวอร์ชัน, หมดอายุเมื่อ)
+        if cached and now < cached[1]:
+            return cached[0]
+
+    try:
+        files = assistant.list_files()
+        signature = "\n".join(sorted(
+            f"{f.id}:{f.updated_on}:{f.status}" for f in files
+        ))
+        version = hashlib.sha1(signature.encode('utf-8')).hexdigest()[:12]
+        expires = now + CORPUS_VERSION_TTL
+    except Exception:
+        # ถ้าเช็คไม่ได้ ใช้เวอร์ชันล่าสุดที่รู้ (หรือ None = ไม่ใช้แคช) แล้วเช็คใหม่เร็วกว่าปกติ
+        # ไม่ใช้ค่าคงที่อย่าง "unknown" เพราะคำตอบที่แคชไว้ภายใต้ค่านั้นจะไม่ถูกล้างเมื่อเอกสารเปลี่ยน
+        version = cached[0] if cached else None
+        expires = now + CORPUS_VERSION_ERROR_TTL
+
+    with _corpus_lock:
+        _corpus_versions[name] = (version, expires)
+    return version
+
+# ============================================================
+# Answer Cache
+# ============================================================
+
+class AnswerCache:
+    """
+    LRU cache ของคำตอบ จำกัดจำนวน และหมดอายุตาม TTL (thread-safe)
+    ถ้ามี backend (shared_cache.py) จะใช้เป็นชั้นที่สองร่วมกับ replica อื่น
+    """
+
+    ANSWERS_NAMESPACE = "answers"
+
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 backend=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt: str, corpus_version: str) -> str:
+        normalized = normalize_prompt(prompt)
+        return hashlib.sha1(f"{corpus_version}\n{normalized}".encode('utf-8')).hexdigest()
+
+    def get(self, prompt: str, corpus_version: Optional[str]):
+        """คืนคำตอบที่แคชไว้ หรือ None ถ้าไม่มี/หมดอายุ (หรือไม่รู้เวอร์ชันของเอกสาร)"""
+        if corpus_version is None:
+            return None
+        key = self.make_key(prompt, corpus_version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+        
+        # ไม่มีใน process นี้ ลองหาจาก shared cache (replica อื่นอาจตอบคำถามนี้ไปแล้ว)
+        answer = self.backend.get(self._shared_key(key)) if self.backend else None
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._store(key, answer)
+        return answer
+
+    def put(self, prompt: str, corpus_version: Optional[str], answer: str):
+        if corpus_version is None:
+            return
+        key = self.make_key(prompt, corpus_version)
+        self._store(key, answer)
+        if self.backend:
+            self.backend.set(self._shared_key(key), answer, self.ttl)
+
+    def _store(self, key: str, answer: str):
+        with self._lock:
+            self._entries[key] = (answer, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _shared_key(self, key: str) -> str:
+        return self.backend.versioned_key(self.ANSWERS_NAMESPACE, key)
+
+    def clear(self):
+        """ล้างแคช (รวมถึงใน shared cache ของทุก replica)"""
+        with self._lock:
+            self._entries.clear()
+        if self.backend:
+            self.backend.bump_version(self.ANSWERS_NAMESPACE)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+# ============================================================
+# Single-Flight (In-Flight Request Coalescing)
+# ============================================================
+
+class _Flight:
+    """คำตอบที่กำลังถูก stream อยู่ (ทั้งคนแรกและผู้ตามอ่าน chunks ที่ได้แล้วจากตรงนี้)"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.cond = threading.Condition()
+
+class SingleFlight:
+    """
+    ถ้ามีคำถามเดียวกัน (key เดียวกัน) กำลังรอคำตอบจาก Assistant อยู่
+    คำถามที่เข้ามาทีหลังจะรอและ stream คำตอบชุดเดียวกัน แทนที่จะเรียก Assistant เอง
+    """
+
+    def __init__(self, timeout: float = SINGLE_FLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def stream(self, key: str, start):
+        """
+        start() ต้องคืน iterator ของข้อความ (เรียกเฉพาะเมื่อเป็นคนแรก)
+        คืนค่า (iterator ของข้อความ, เป็นการรอคำตอบของคนอื่นหรือไม่)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            shared = flight is not None
+            if shared:
+                self.coalesced += 1
+            else:
+                flight = self._flights[key] = _Flight()
+                self.upstream_calls += 1
+        if not shared:
+            # อ่านคำตอบจาก Assistant ใน thread แยก ไม่ใช่ใน generator ของคนแรก
+            # คนแรกเลิกอ่านกลางทาง (เช่น st.rerun หรือปิดหน้าเว็บ) คนที่รออยู่ยังได้คำตอบครบ
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(self._pump, key, flight, start),
+                             name="single-flight", daemon=True).start()
+        return self._follow(flight), shared
+
+    def call(self, key: str, fn):
+        """แบบไม่ stream: fn() คืนข้อความทั้งก้อน คืนค่า (ข้อความ, เป็นการรอคำตอบของคนอื่นหรือไม่)"""
+        chunks, shared = self.stream(key, lambda: iter([fn()]))
+        return "".join(chunks), shared
+
+    def _pump(self, key, flight, start):
+        error = None
+        try:
+            for delta in start():
+                with flight.cond:
+                    flight.chunks.append(delta)
+                    flight.cond.notify_all()
+        except Exception as e:
+            error = e
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.cond:
+                flight.done = True
+                flight.error = error
+                flight.cond.notify_all()
+
+    def _follow(self, flight):
+        position = 0
+        while True:
+            with flight.cond:
+                if not flight.cond.wait_for(lambda: len(flight.chunks) > position or flight.done,
+                                            self.timeout):
+                    raise TimeoutError("timed out waiting for an identical in-flight request")
+                chunks = flight.chunks[position:]
+                done, error = flight.done, flight.error
+            position += len(chunks)
+            yield from chunks
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "upstream_calls": self.upstream_calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights)
+            }
@@ -3,9 +3,6 @@ AI Chatbot for UNAI
 """
 
 import streamlit as st
-import time
-import hashlib
-from datetime import datetime
 
 st.set_page_config(
     page_title="UNAI Chatbot",
@@ -15,19 +12,29 @@ st.set_page_config(
 )
 
 # Import modules
+import telemetry
 from styles import inject_css
 from login_page import check_authentication
 from logic import (
-    load_sessions_from_db, 
-    save_session_to_db, 
-    t
+    load_session_headers_from_db, 
+    sync_sessions_from_db, 
+    new_chat_session
 )
 from chat_page import show_chat_page
 
+telemetry.configure()
+
 # ============================================================
 # Check Authentication
 # ============================================================
-check_authentication()
+with telemetry.span("app.check_authentication"):
+    check_authentication()
+
+# ติด tag user/session ให้ทุก span ของ rerun นี้ (รวมถึงการโหลดแชทตอน login ด้านล่าง)
+telemetry.set_context(
+    user=st.session_state.user.id,
+    session=st.session_state.get("current_session_id")
+)
 
 # ============================================================
 # State Management
@@ -42,27 +49,21 @@ if "language" not in st.session_state:
 # Load Sessions from Database (After Authentication)
 # ============================================================
 if "chat_sessions" not in st.session_state:
-    # โหลดจาก database
-    loaded_sessions = load_sessions_from_db()
+    # โหลดเฉพาะหัวแชทจาก database (ข้อความโหลดเมื่อเปิดแชท)
+    with telemetry.span("app.load_sessions"):
+        loaded_sessions = load_session_headers_from_db()
     
     if loaded_sessions:
         st.session_state.chat_sessions = loaded_sessions
         # ตั้ง current_session_id เป็น session แรก
         st.session_state.current_session_id = list(loaded_sessions.keys())[0]
     else:
-        # ถ้าไม่มีข้อมูล สร้างแชทแรก
-        new_id = hashlib.md5(str(time.time()).encode()).hexdigest()
-        new_session = {
-            "messages": [],
-            "created_at": datetime.now().isoformat(),
-            "title": t("new_chat"),
-            "thread_id": None
-        }
-        st.session_state.chat_sessions = {new_id: new_session}
-        st.session_state.current_session_id = new_id
-        
-        # บันทึกลง database
-        save_session_to_db(new_id, new_session)
+        # ถ้าไม่มีข้อมูล สร้างแชทแรก (บันทึกลง database เมื่อส่งข้อความแรก)
+        st.session_state.chat_sessions = {}
+        new_chat_session()
+else:
+    # ดึงเฉพาะแชทที่เปลี่ยนจากแท็บ/อุปกรณ์อื่นตั้งแต่ sync ครั้งก่อน
+    sync_sessions_from_db()
 
 if "current_session_id" not in st.session_state:
     # Fallback ถ้ายังไม่มี
@@ -72,12 +73,20 @@ if "current_session_id" not in st.session_state:
 if "renaming_session_id" not in st.session_state:
     st.session_state.renaming_session_id = None
 
+# แชทปัจจุบันอาจเพิ่งถูกเลือกหลังโหลดแชท
+telemetry.set_context(
+    user=st.session_state.user.id,
+    session=st.session_state.get("current_session_id")
+)
+
 # ============================================================
 # CSS & Theme
 # ============================================================
-inject_css()
+with telemetry.span("app.inject_css"):
+    inject_css()
 
 # ============================================================
 # Main App Logic
 # ============================================================
-show_chat_page()
+with telemetry.span("app.show_chat_page"):
+    show_chat_page()
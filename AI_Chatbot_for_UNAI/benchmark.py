@@ -0,0 +1,341 @@
+"""
+AI Chatbot for UNAI - Offline Benchmark
+วัดความเร็วของ hot path ต่างๆ โดยไม่ต้องใช้ Pinecone / Supabase จริง
+(ใช้ backend จำลองจาก fake_backends.py)
+
+ตัวอย่าง:
+    python benchmark.py --users 5 --sessions 50 --messages 40 --db-latency-ms 20
+    python benchmark.py --only save_append,save_full,save_append_rpc,save_full_rpc --json results.json
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+from collections import Counter, defaultdict
+from contextlib import contextmanager, redirect_stdout
+
+from fake_backends import (
+    LatencyModel,
+    FakeSupabase,
+    FakeAssistant,
+    FakeFilesSession,
+    fake_drive_download
+)
+
+OPERATIONS = [
+    "load_full",
+    "load_headers",
+    "open_chat",
+    "save_append",
+    "save_full",
+    "save_append_rpc",
+    "save_full_rpc",
+    "save_write_behind",
+    "sync_delta",
+    "chat_page_rerun",
+    "upload_pipeline",
+]
+
+# ============================================================
+# Recorder
+# ============================================================
+
+def percentile(values, pct):
+    """percentile แบบ nearest-rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+class Recorder:
+    """เก็บเวลาและจำนวนการเรียก backend ต่อ operation"""
+
+    def __init__(self, backends):
+        self.backends = backends
+        self.durations = defaultdict(list)
+        self.calls = defaultdict(Counter)
+        self.errors = Counter()
+
+    def _snapshot(self):
+        calls = Counter()
+        failures = 0
+        for backend in self.backends:
+            calls.update(backend.calls)
+            failures += backend.latency.failures
+        return calls, failures
+
+    @contextmanager
+    def measure(self, operation):
+        calls_before, failures_before = self._snapshot()
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors[operation] += 1
+        finally:
+            self.durations[operation].append((time.perf_counter() - start) * 1000)
+            calls_after, failures_after = self._snapshot()
+            calls_after.subtract(calls_before)
+            self.calls[operation].update(+calls_after)
+            self.errors[operation] += failures_after - failures_before
+
+    def summary(self):
+        rows = []
+        for operation, durations in self.durations.items():
+            n = len(durations)
+            rows.append({
+                "operation": operation,
+                "n": n,
+                "p50_ms": round(percentile(durations, 50), 2),
+                "p95_ms": round(percentile(durations, 95), 2),
+                "p99_ms": round(percentile(durations, 99), 2),
+                "mean_ms": round(sum(durations) / n, 2),
+                "errors": self.errors[operation],
+                "calls_per_op": {k: round(v / n, 2) for k, v in sorted(self.calls[operation].items())}
+            })
+        return rows
+
+def print_summary(rows):
+    print(f"\n{'Operation':<18} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}  calls/op")
+    print("-" * 100)
+    for row in rows:
+        calls = ", ".join(f"{k}={v:g}" for k, v in row["calls_per_op"].items())
+        print(f"{row['operation']:<18} {row['n']:>5} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+              f"{row['p99_ms']:>9.2f} {row['errors']:>7}  {calls}")
+    print()
+
+# ============================================================
+# App Wiring
+# ============================================================
+
+class BenchSessionState(dict):
+    """แทน st.session_state เมื่อเรียกฟังก์ชันใน logic.py นอก streamlit run"""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+@contextmanager
+def bare_session_state(**values):
+    import streamlit as st
+    original = st.session_state
+    st.session_state = BenchSessionState(language="th", **values)
+    try:
+        yield st.session_state
+    finally:
+        st.session_state = original
+
+def load_app(db, assistant):
+    """import logic.py / chat_page.py โดยให้ใช้ backend จำลอง"""
+    os.environ["SUPABASE_URL"] = os.environ["SUPABASE_KEY"] = "benchmark"
+    os.environ["PINECONE_API_KEY"] = ""  # กันไม่ให้ต่อ Pinecone จริง
+    os.environ.setdefault("TELEMETRY_LOG", "off")
+    os.environ.setdefault("WRITE_BEHIND", "0")  # save_append/save_full วัดการเขียนแบบ sync
+    os.environ.setdefault("SAVE_RPC", "0")      # save_append/save_full วัดแบบ REST, *_rpc วัดแบบ RPC
+    import supabase as supabase_package
+    supabase_package.create_client = lambda url, key: db
+
+    import logic
+    logic.supabase = db
+    logic.assistant = assistant
+    import chat_page
+    chat_page.assistant = assistant
+    return logic
+
+def user_of(u):
+    return types.SimpleNamespace(id=f"user-{u}", email=f"user{u}@example.com")
+
+def load_seeded_sessions(logic, attempts=10):
+    """โหลดแชทตั้งต้นของ workload (ลองซ้ำเมื่อ --failure-rate ทำให้โหลดไม่สำเร็จ)"""
+    for _ in range(attempts):
+        sessions = logic.load_sessions_from_db()
+        if sessions:
+            return sessions
+    raise RuntimeError("could not load seeded sessions")
+
+# ============================================================
+# Workloads
+# ============================================================
+
+def bench_loads(logic, recorder, args):
+    for _ in range(args.iterations):
+        for u in range(args.users):
+            with bare_session_state(user=user_of(u)) as state:
+                with recorder.measure("load_full"):
+                    logic.load_sessions_from_db()
+                with recorder.measure("load_headers"):
+                    state.chat_sessions = logic.load_session_headers_from_db()
+                with recorder.measure("open_chat"):
+                    logic.ensure_session_messages(next(iter(state.chat_sessions)))
+
+# (operation, full, บันทึกผ่าน RPC save_chat_changes แทน REST หลายครั้ง)
+SAVE_OPERATIONS = [
+    ("save_append", False, False),
+    ("save_full", True, False),
+    ("save_append_rpc", False, True),
+    ("save_full_rpc", True, True),
+]
+
+def bench_saves(logic, recorder, args, selected):
+    original = logic.SAVE_RPC
+    for operation, full, rpc in SAVE_OPERATIONS:
+        if operation not in selected:
+            continue
+        logic.SAVE_RPC = rpc
+        for u in range(args.users):
+            with bare_session_state(user=user_of(u)) as state:
+                state.chat_sessions = load_seeded_sessions(logic)
+                session_id = next(iter(state.chat_sessions))
+                session = state.chat_sessions[session_id]
+                for i in range(args.iterations):
+                    session["messages"].append({"role": "user", "content": f"question {i}"})
+                    session["messages"].append({"role": "assistant", "content": f"answer {i}"})
+                    with recorder.measure(operation):
+                        logic.save_session_to_db(session_id, session, full=full)
+    logic.SAVE_RPC = original
+
+def bench_write_behind(logic, recorder, args):
+    """วัดเวลาที่ผู้ใช้ต้องรอเมื่อบันทึกผ่าน write-behind queue (การเขียนจริงเกิดใน background)"""
+    from write_behind import WriteBehindQueue
+
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = WriteBehindQueue(logic.write_session_changes, os.path.join(tmp, "journal.jsonl"))
+        original, logic.write_queue = logic.write_queue, queue
+        try:
+            for u in range(args.users):
+                with bare_session_state(user=user_of(u)) as state:
+                    state.chat_sessions = load_seeded_sessions(logic)
+                    session_id = next(iter(state.chat_sessions))
+                    session = state.chat_sessions[session_id]
+                    for i in range(args.iterations):
+                        session["messages"].append({"role": "user", "content": f"question {i}"})
+                        session["messages"].append({"role": "assistant", "content": f"answer {i}"})
+                        with recorder.measure("save_write_behind"):
+                            logic.save_session_to_db(session_id, session)
+            queue.close(timeout=60)
+            print(f"📝 Write-behind: {queue.stats['submitted']} submitted, "
+                  f"{queue.stats['batches']} batch(es), {queue.stats['retries']} retries")
+        finally:
+            logic.write_queue = original
+
+def bench_sync(logic, db, recorder, args):
+    """refresh แบบ delta หลังอีกแท็บเพิ่มข้อความหนึ่งคู่ (เทียบกับ load_full / load_headers)"""
+    for u in range(args.users):
+        with bare_session_state(user=user_of(u)) as state:
+            state.chat_sessions = logic.load_session_headers_from_db()
+            session_id = next(iter(state.chat_sessions))
+            logic.ensure_session_messages(session_id)
+            for i in range(args.iterations):
+                # การเขียนจากแท็บ/อุปกรณ์อื่น (ไม่ผ่าน session state นี้)
+                db.table("chat_messages").insert([
+                    {"session_id": session_id, "role": "user", "content": f"other tab {i}"},
+                    {"session_id": session_id, "role": "assistant", "content": f"answer {i}"}
+                ]).execute()
+                with recorder.measure("sync_delta"):
+                    logic.sync_sessions_from_db(force=True)
+
+def bench_chat_page(recorder, args):
+    from streamlit.testing.v1 import AppTest
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+    for u in range(args.users):
+        at = AppTest.from_file(app_path, default_timeout=120)
+        at.session_state["user"] = user_of(u)
+        with recorder.measure("chat_page_rerun"):
+            at.run()
+        for i in range(args.iterations):
+            with recorder.measure("chat_page_rerun"):
+                at.chat_input[0].set_value(f"benchmark question {u}-{i}").run()
+            if at.exception:
+                recorder.errors["chat_page_rerun"] += 1
+
+def bench_upload(recorder, args):
+    import upload_documents
+
+    drive_latency = LatencyModel(args.drive_latency_ms, args.drive_latency_ms / 2, seed=1)
+    files_session = FakeFilesSession(LatencyModel(args.upload_latency_ms, args.upload_latency_ms / 2,
+                                                  args.failure_rate, seed=2))
+    recorder.backends.append(files_session)
+    upload_documents.build_drive_service = lambda creds: None
+    upload_documents.download_document = fake_drive_download(drive_latency, args.file_kb * 1024)
+    upload_documents.create_upload_session = lambda workers=None: files_session
+    upload_documents.AdaptiveBackoff.__init__.__defaults__ = (0.01, 0.5)
+
+    files = [{"id": str(i), "name": f"doc-{i}.pdf", "mimeType": "application/pdf"}
+             for i in range(args.files)]
+    for _ in range(args.iterations):
+        with recorder.measure("upload_pipeline"), redirect_stdout(io.StringIO()):
+            upload_documents.run_ingestion_pipeline(None, files, "benchmark", "benchmark")
+
+# ============================================================
+# Main Function
+# ============================================================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark with fake Supabase/Pinecone")
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--sessions', type=int, default=30, help="sessions per user")
+    parser.add_argument('--messages', type=int, default=20, help="messages per session")
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--db-latency-ms', type=float, default=5.0)
+    parser.add_argument('--assistant-latency-ms', type=float, default=50.0,
+                        help="time to first token")
+    parser.add_argument('--token-latency-ms', type=float, default=1.0)
+    parser.add_argument('--drive-latency-ms', type=float, default=20.0)
+    parser.add_argument('--upload-latency-ms', type=float, default=30.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help="probability that a backend call fails")
+    parser.add_argument('--files', type=int, default=20, help="documents in the upload workload")
+    parser.add_argument('--file-kb', type=int, default=512)
+    parser.add_argument('--only', help=f"comma-separated subset of: {', '.join(OPERATIONS)}")
+    parser.add_argument('--json', metavar='FILE', help="also write results as JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    selected = set(args.only.split(",")) if args.only else set(OPERATIONS)
+
+    db = FakeSupabase(LatencyModel(args.db_latency_ms, args.db_latency_ms / 2, args.failure_rate, seed=3))
+    db.seed(args.users, args.sessions, args.messages)
+    assistant = FakeAssistant(LatencyModel(args.assistant_latency_ms, 0, args.failure_rate, seed=4),
+                              token_latency_ms=args.token_latency_ms)
+    recorder = Recorder([db, assistant])
+    logic = load_app(db, assistant)
+
+    print(f"🏁 Workload: {args.users} user(s) × {args.sessions} session(s) × {args.messages} message(s), "
+          f"{args.iterations} iteration(s)")
+    if selected & {"load_full", "load_headers", "open_chat"}:
+        bench_loads(logic, recorder, args)
+    if selected & {operation for operation, _, _ in SAVE_OPERATIONS}:
+        bench_saves(logic, recorder, args, selected)
+    if "save_write_behind" in selected:
+        bench_write_behind(logic, recorder, args)
+    if "sync_delta" in selected:
+        bench_sync(logic, db, recorder, args)
+    if "chat_page_rerun" in selected:
+        bench_chat_page(recorder, args)
+    if "upload_pipeline" in selected:
+        bench_upload(recorder, args)
+
+    rows = [row for row in recorder.summary() if row["operation"] in selected]
+    print_summary(rows)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Benchmark interrupted by user\n", file=sys.stderr)
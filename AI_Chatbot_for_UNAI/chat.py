@@ -3,10 +3,18 @@ AI Chatbot for UNAI - Chat Interface
 สำหรับถามคำถามกับ chatbot
 """
 
+import argparse
+import json
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pinecone import Pinecone
 from pinecone_plugins.assistant.models.chat import Message
 from dotenv import load_dotenv
+from answer_cache import AnswerCache, SingleFlight, get_corpus_version
+from shared_cache import create_cache_backend
 
 # Load environment variables
 load_dotenv()
@@ -15,6 +23,13 @@ load_dotenv()
 PINECONE_API_KEY = os.getenv('PINECONE_API_KEY')
 ASSISTANT_NAME = os.getenv('ASSISTANT_NAME', 'unai-chatbot')
 
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '8'))
+
+# แคชคำตอบของคำถามซ้ำ (ตลอดการทำงานของ process และใน shared cache ถ้าตั้ง SHARED_CACHE)
+answer_cache = AnswerCache(backend=create_cache_backend())
+# คำถามเดียวกันที่ถามพร้อมกัน (เช่นใน batch) เรียก Assistant ครั้งเดียว
+inflight_requests = SingleFlight()
+
 # ============================================================
 # Functions
 # ============================================================
@@ -27,19 +42,50 @@ def print_header():
     print("Type your questions below. Type 'quit' to exit.")
     print("="*60 + "\n")
 
+@lru_cache(maxsize=1)
+def get_assistant():
+    """สร้าง Pinecone client และ Assistant ครั้งเดียว ใช้ซ้ำตลอดการทำงานของ process"""
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+    return pc.assistant.Assistant(ASSISTANT_NAME)
+
+def answer_question(question: str):
+    """
+    ถามคำถามกับ chatbot ถ้าผิดพลาดจะ raise
+    คืน (คำตอบ, ไม่ได้เรียก Assistant เอง เพราะมาจากแคชหรือรอคำตอบของคำถามเดียวกันที่ถามอยู่)
+    """
+    assistant = get_assistant()
+    
+    # ถ้าเคยถามแล้ว (กับเอกสารชุดเดียวกัน) ตอบจากแคชเลย
+    version = get_corpus_version(assistant)
+    cached = answer_cache.get(question, version)
+    if cached is not None:
+        return cached, True
+    
+    def call_assistant():
+        msg = Message(content=question)
+        return assistant.chat(messages=[msg]).message.content
+    
+    # ถ้าคำถามเดียวกันกำลังรอคำตอบอยู่ ให้รอคำตอบนั้นแทนการเรียกซ้ำ
+    if inflight_requests is None:
+        answer, shared = call_assistant(), False
+    else:
+        answer, shared = inflight_requests.call(answer_cache.make_key(question, version), call_assistant)
+    answer_cache.put(question, version, answer)
+    return answer, shared
+
 def ask(question: str) -> str:
     """ถามคำถามกับ chatbot"""
     try:
-        pc = Pinecone(api_key=PINECONE_API_KEY)
-        assistant = pc.assistant.Assistant(ASSISTANT_NAME)
-        
-        msg = Message(content=question)
-        resp = assistant.chat(messages=[msg])
-        
-        return resp.message.content
+        return answer_question(question)[0]
     except Exception as e:
         return f"❌ Error: {str(e)}"
 
+def print_cache_stats():
+    """แสดงสถิติแคชคำตอบ"""
+    stats = answer_cache.stats()
+    print(f"📊 Cache: {stats['hits']} hits / {stats['misses']} misses "
+          f"(hit rate {stats['hit_rate']:.0%})\n")
+
 def interactive_mode():
     """โหมดแชทแบบ interactive"""
     print_header()
@@ -59,6 +105,7 @@ def interactive_mode():
             # ตรวจสอบคำสั่งพิเศษ
             if question.lower() in ['quit', 'exit', 'q', 'ออก', 'พอ']:
                 print("\n👋 Goodbye! See you next time.\n")
+                print_cache_stats()
                 break
             
             if not question:
@@ -71,6 +118,7 @@ def interactive_mode():
             
         except KeyboardInterrupt:
             print("\n\n👋 Goodbye! See you next time.\n")
+            print_cache_stats()
             break
         except Exception as e:
             print(f"\n❌ Error: {str(e)}\n")
@@ -87,18 +135,129 @@ def single_question_mode(question: str):
     print(f"💬 Answer:\n{answer}")
     print("-" * 60 + "\n")
 
+def parse_batch_line(line, line_no):
+    """
+    แปลงหนึ่งบรรทัดของ JSONL เป็นคำถาม
+    บรรทัดที่ใช้ไม่ได้จะคืน item ที่มี "error" (เขียนเป็นผลของข้อนั้น แทนการหยุดทั้ง batch)
+    """
+    try:
+        item = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"id": line_no, "question": None, "error": f"invalid JSON on line {line_no}: {e}"}
+    if isinstance(item, str):
+        item = {"question": item}
+    if not isinstance(item, dict):
+        return {"id": line_no, "question": None,
+                "error": f"line {line_no} must be a string or an object with \"question\""}
+    item.setdefault("id", line_no)
+    question = item.get("question")
+    if not isinstance(question, str) or not question.strip():
+        return {"id": item["id"], "question": question,
+                "error": f"line {line_no} has no \"question\" text"}
+    return item
+
+def read_batch_questions(source):
+    """อ่านคำถามจาก JSONL (แต่ละบรรทัดเป็น {"id": ..., "question": ...} หรือ string)"""
+    questions = []
+    for line_no, line in enumerate(source, 1):
+        line = line.strip()
+        if not line:
+            continue
+        questions.append(parse_batch_line(line, line_no))
+    return questions
+
+def answer_batch_item(item):
+    """ตอบคำถามหนึ่งข้อในโหมด batch พร้อมจับเวลา"""
+    start = time.perf_counter()
+    result = {"id": item["id"], "question": item["question"]}
+    try:
+        if item.get("error"):
+            raise ValueError(item["error"])
+        result["answer"], result["cached"] = answer_question(item["question"])
+        result["error"] = None
+    except Exception as e:
+        result["answer"], result["cached"] = None, False
+        result["error"] = str(e)
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+def batch_mode(input_path: str, output_path: str = None, workers: int = BATCH_WORKERS):
+    """โหมด batch: ตอบคำถามจากไฟล์ JSONL พร้อมกันหลาย worker แล้วเขียนผลเป็น JSONL"""
+    if not PINECONE_API_KEY:
+        print("❌ Error: PINECONE_API_KEY not found in .env file\n", file=sys.stderr)
+        return
+    
+    if input_path == "-":
+        questions = read_batch_questions(sys.stdin)
+    else:
+        with open(input_path, 'r', encoding='utf-8') as f:
+            questions = read_batch_questions(f)
+    
+    get_assistant()  # สร้าง client ก่อนเริ่ม worker
+    out = open(output_path, 'w', encoding='utf-8') if output_path else sys.stdout
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # executor.map คืนผลตามลำดับคำถาม แต่ประมวลผลพร้อมกัน
+            for result in executor.map(answer_batch_item, questions):
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                latencies.append(result["latency_ms"])
+                errors += result["error"] is not None
+    finally:
+        if output_path:
+            out.close()
+    
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    if latencies:
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"📊 {len(latencies)} question(s) in {elapsed:.1f}s with {workers} worker(s), "
+              f"{errors} error(s), p50 {p50:.0f} ms, p95 {p95:.0f} ms", file=sys.stderr)
+    stats = answer_cache.stats()
+    print(f"📊 Cache: {stats['hits']} hits / {stats['misses']} misses", file=sys.stderr)
+    if inflight_requests is not None:
+        flights = inflight_requests.stats()
+        print(f"📊 Coalesced: {flights['coalesced']} identical in-flight question(s) shared "
+              f"{flights['upstream_calls']} assistant call(s)", file=sys.stderr)
+
 # ============================================================
 # Main Function
 # ============================================================
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="AI Chatbot for UNAI - Chat Interface")
+    parser.add_argument('question', nargs='*', help="ask a single question and exit")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="answer questions from a JSONL file ('-' for stdin)")
+    parser.add_argument('--output', metavar='FILE',
+                        help="write batch results to FILE instead of stdout")
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS,
+                        help=f"concurrent questions in batch mode (default: {BATCH_WORKERS})")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always ask the assistant (skip the answer cache and request coalescing)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main execution function"""
-    import sys
+    global inflight_requests
+    args = parse_args(argv)
+    
+    if args.no_cache:
+        answer_cache.max_size = 0
+        answer_cache.backend = None
+        inflight_requests = None
     
-    # ตรวจสอบว่ามี argument ส่งมาหรือไม่
-    if len(sys.argv) > 1:
+    if args.batch:
+        # โหมด batch สำหรับ regression run
+        batch_mode(args.batch, args.output, args.workers)
+    elif args.question:
         # ถ้ามี argument = ถามคำถามเดียว
-        question = " ".join(sys.argv[1:])
+        question = " ".join(args.question)
         single_question_mode(question)
     else:
         # ถ้าไม่มี = เข้าโหมด interactive
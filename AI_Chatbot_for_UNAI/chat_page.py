@@ -1,14 +1,32 @@
+import time
 import streamlit as st
-from pinecone_plugins.assistant.models.chat import Message
+import telemetry
 from logic import (
     t, 
     create_new_chat, 
     delete_chat, 
     save_session_to_db, 
     delete_session_from_db, 
+    ensure_session_messages, 
+    ensure_message_window, 
+    MESSAGE_WINDOW, 
+    stream_assistant_reply, 
+    build_chat_context, 
+    answer_cache, 
+    inflight_requests, 
+    corpus_version, 
+    SHOW_CACHE_STATS, 
+    SIDEBAR_PAGE_SIZE, 
+    get_session_order, 
+    search_chat_history, 
+    snippet_to_markdown, 
+    SEARCH_PAGE_SIZE, 
+    search_local_documents, 
+    LOCAL_SEARCH_COMMAND, 
     assistant
 )
 from login_page import logout
+from local_index import format_passages
 
 def show_chat_page():
     # ============================================================
@@ -30,7 +48,7 @@ def show_chat_page():
     # ============================================================
     # Sidebar
     # ============================================================
-    with st.sidebar:
+    with telemetry.span("ui.sidebar"), st.sidebar:
         # Header
         st.title("🤖 UNAI Chat")
         
@@ -50,22 +68,28 @@ def show_chat_page():
         
         st.markdown(f"### {t('your_chats')}")
         
-        # Sort sessions by date
-        sorted_sessions = sorted(
-            st.session_state.chat_sessions.items(),
-            key=lambda x: x[1]['created_at'],
-            reverse=True
-        )
+        # ลำดับแชท (ใหม่สุดก่อน) ไม่ต้อง sort ใหม่ทุก rerun
+        order = get_session_order()
+        
+        # Filter by search
+        if search_query:
+            order = [
+                sid for sid in order
+                if search_query in st.session_state.chat_sessions[sid].get('title', 'Untitled').lower()
+            ]
+        
+        # แบ่งหน้า: สร้าง widget เฉพาะแชทในหน้าที่แสดงอยู่
+        if st.session_state.get("sidebar_search") != search_query:
+            st.session_state.sidebar_search = search_query
+            st.session_state.sidebar_page = 0
+            st.session_state.search_page = 0
+        total_pages = max(1, -(-len(order) // SIDEBAR_PAGE_SIZE))
+        page = min(st.session_state.get("sidebar_page", 0), total_pages - 1)
+        visible = order[page * SIDEBAR_PAGE_SIZE:(page + 1) * SIDEBAR_PAGE_SIZE]
         
         # Render Chat List
-        for sid, session_data in sorted_sessions:
-            title = session_data.get('title', 'Untitled')
-            
-            # Filter by search
-            if search_query and search_query not in title.lower():
-                continue
-                
-            is_active = (sid == st.session_state.current_session_id)
+        for sid in visible:
+            title = st.session_state.chat_sessions[sid].get('title', 'Untitled')
             
             # We use a container for the row
             col_name, col_action = st.columns([0.8, 0.2])
@@ -76,33 +100,92 @@ def show_chat_page():
                     st.rerun()
                     
             with col_action:
-                try:
-                    with st.popover("⋮", help="Options"):
-                        st.write(t("settings"))
-                        
-                        # Rename
-                        new_name = st.text_input(t("rename"), value=title, key=f"rename_{sid}")
-                        if st.button(t("save"), key=f"save_rename_{sid}"):
+                if st.button("⋮", key=f"opt_{sid}", help="Options"):
+                    # เปิด/ปิดเมนูแก้ไขของแชทนี้
+                    editing = st.session_state.renaming_session_id == sid
+                    st.session_state.renaming_session_id = None if editing else sid
+                    st.rerun()
+            
+            # สร้างช่อง rename/ปุ่มลบ เฉพาะแชทที่กำลังแก้ไข
+            if st.session_state.renaming_session_id == sid:
+                with st.container(border=True):
+                    st.write(t("settings"))
+                    
+                    # Rename
+                    new_name = st.text_input(t("rename"), value=title, key=f"rename_{sid}")
+                    col_save, col_cancel = st.columns(2)
+                    with col_save:
+                        if st.button(t("save"), key=f"save_rename_{sid}", use_container_width=True):
                             st.session_state.chat_sessions[sid]['title'] = new_name
                             save_session_to_db(sid, st.session_state.chat_sessions[sid])
+                            st.session_state.renaming_session_id = None
                             st.rerun()
-                            
-                        st.divider()
-                        
-                        # Delete
-                        if st.button(t("delete"), key=f"del_{sid}", type="primary"):
-                            delete_chat(sid)
-                except AttributeError:
-                    # Fallback for older Streamlit versions
-                    if is_active:
-                        with st.expander("⚙️"):
-                            new_name = st.text_input(t("rename"), value=title, key=f"rename_{sid}")
-                            if st.button(t("save"), key=f"save_rename_{sid}"):
-                                st.session_state.chat_sessions[sid]['title'] = new_name
-                                save_session_to_db(sid, st.session_state.chat_sessions[sid])
-                                st.rerun()
-                            if st.button(t("delete"), key=f"del_{sid}"):
-                                delete_chat(sid)
+                    with col_cancel:
+                        if st.button(t("cancel"), key=f"cancel_rename_{sid}", use_container_width=True):
+                            st.session_state.renaming_session_id = None
+                            st.rerun()
+                    
+                    st.divider()
+                    
+                    # Delete
+                    if st.button(t("delete"), key=f"del_{sid}", type="primary", use_container_width=True):
+                        delete_chat(sid)
+        
+        # Pagination
+        if total_pages > 1:
+            col_prev, col_page, col_next = st.columns([0.3, 0.4, 0.3])
+            with col_prev:
+                if st.button("◀", key="page_prev", disabled=page == 0, use_container_width=True):
+                    st.session_state.sidebar_page = page - 1
+                    st.rerun()
+            with col_page:
+                st.caption(f"{page + 1} / {total_pages}")
+            with col_next:
+                if st.button("▶", key="page_next", disabled=page >= total_pages - 1, use_container_width=True):
+                    st.session_state.sidebar_page = page + 1
+                    st.rerun()
+
+        # ค้นหาในเนื้อหาข้อความ (full-text search ฝั่ง database)
+        if search_query.strip():
+            st.markdown(f"### {t('message_results')}")
+            search_page = st.session_state.get("search_page", 0)
+            results, total = search_chat_history(search_query.strip(), search_page)
+            
+            if not results:
+                st.caption(t("no_results"))
+            for result in results:
+                sid = result["session_id"]
+                if st.button(result["title"] or "Untitled", key=f"hit_{sid}", use_container_width=True):
+                    if sid in st.session_state.chat_sessions:
+                        st.session_state.current_session_id = sid
+                        st.rerun()
+                st.caption(snippet_to_markdown(result["snippet"]))
+            
+            search_pages = max(1, -(-total // SEARCH_PAGE_SIZE))
+            if search_pages > 1:
+                col_prev, col_page, col_next = st.columns([0.3, 0.4, 0.3])
+                with col_prev:
+                    if st.button("◀", key="search_prev", disabled=search_page == 0, use_container_width=True):
+                        st.session_state.search_page = search_page - 1
+                        st.rerun()
+                with col_page:
+                    st.caption(f"{search_page + 1} / {search_pages}")
+                with col_next:
+                    if st.button("▶", key="search_next", disabled=search_page >= search_pages - 1, use_container_width=True):
+                        st.session_state.search_page = search_page + 1
+                        st.rerun()
+
+        # สถิติแคชคำตอบ (เปิดด้วย SHOW_CACHE_STATS=1)
+        if SHOW_CACHE_STATS:
+            stats = answer_cache.stats()
+            st.caption(f"⚡ Cache: {stats['hits']} hits / {stats['misses']} misses ({stats['size']} entries)")
+            flights = inflight_requests.stats()
+            st.caption(f"🔗 Coalesced: {flights['coalesced']} / {flights['upstream_calls']} assistant calls")
+            session = st.session_state.chat_sessions.get(st.session_state.current_session_id) or {}
+            report = session.get("_context_report")
+            if report:
+                st.caption(f"🧮 Context: {report['tokens']} / {report['budget']} tokens "
+                           f"({report['recent_turns']} recent, {report['summarized_turns']} summarized turns)")
 
     # ============================================================
     # Main Chat Area
@@ -113,7 +196,8 @@ def show_chat_page():
         # Fallback if session missing
         create_new_chat()
 
-    current_session = st.session_state.chat_sessions[st.session_state.current_session_id]
+    # โหลดข้อความของแชทนี้ครั้งแรกที่เปิด
+    current_session = ensure_session_messages(st.session_state.current_session_id)
 
     # Welcome Message if empty
     if not current_session["messages"]:
@@ -124,10 +208,22 @@ def show_chat_page():
         </div>
         """, unsafe_allow_html=True)
 
-    # Display Messages
-    for msg in current_session["messages"]:
-        with st.chat_message(msg["role"]):
-            st.markdown(msg["content"], unsafe_allow_html=False)
+    # Display Messages (แสดงเฉพาะ window ล่าสุด กด "ดูข้อความก่อนหน้า" เพื่อย้อนดูทีละหน้า)
+    windows = st.session_state.setdefault("message_windows", {})
+    window = windows.get(st.session_state.current_session_id, MESSAGE_WINDOW)
+    ensure_message_window(st.session_state.current_session_id, window)
+    messages = current_session["messages"]
+    
+    if len(messages) > window or current_session.get("_has_older"):
+        if st.button(f"⬆️ {t('load_older')}", key="load_older", use_container_width=True):
+            windows[st.session_state.current_session_id] = window + MESSAGE_WINDOW
+            st.rerun()
+    
+    visible_messages = messages[-window:] if window else []
+    with telemetry.span("ui.messages", count=len(visible_messages)):
+        for msg in visible_messages:
+            with st.chat_message(msg["role"]):
+                st.markdown(msg["content"], unsafe_allow_html=False)
 
     # Chat Input
     if prompt := st.chat_input(t("input_placeholder")):
@@ -140,41 +236,79 @@ def show_chat_page():
         with st.chat_message("assistant"):
             # สร้าง placeholder สำหรับแสดงผล
             message_placeholder = st.empty()
+            reply = ""
+            failed = False
+            local_query = None
+            if prompt.startswith(LOCAL_SEARCH_COMMAND + " "):
+                local_query = prompt[len(LOCAL_SEARCH_COMMAND):].strip()
             
-            # แสดง spinner
-            with st.spinner(t("thinking")):
-                try:
-                    if assistant:
-                        # ใช้ thread_id แยกตามแชท
-                        thread_id = current_session.get("thread_id")
-                        
-                        # สร้าง message
-                        msg = Message(content=prompt)
+            try:
+                if local_query:
+                    # ค้นหาเอกสารจากดัชนีบนเครื่อง ไม่ต้องเรียก Assistant
+                    passages = search_local_documents(local_query)
+                    if passages is None:
+                        reply = t("local_index_missing")
+                    else:
+                        reply = format_passages(passages) or t("no_documents")
+                elif assistant:
+                    # คำถามแรกของแชท (ไม่มีประวัติ/thread) คำตอบขึ้นกับคำถามอย่างเดียว จึงใช้แคชได้
+                    context = build_chat_context(current_session)
+                    cacheable = len(context) == 1 if context else not current_session.get("thread_id")
+                    version = corpus_version() if cacheable else None
+                    cached = answer_cache.get(prompt, version) if cacheable else None
+                    
+                    if cached is not None:
+                        reply = cached
+                    else:
+                        # แสดงข้อความ "กำลังคิด" จนกว่าจะได้ส่วนแรกของคำตอบ
+                        message_placeholder.markdown(f"_{t('thinking')}_")
                         
-                        # ส่งไปยัง Pinecone พร้อม thread_id
-                        if thread_id:
-                            response = assistant.chat(messages=[msg], thread_id=thread_id)
+                        # ถ้ามีคนถามคำถามเดียวกันและกำลังรอคำตอบอยู่ ให้ stream คำตอบนั้นแทนการเรียกซ้ำ
+                        if cacheable:
+                            deltas, shared = inflight_requests.stream(
+                                answer_cache.make_key(prompt, version),
+                                lambda: stream_assistant_reply(prompt, current_session, context)
+                            )
                         else:
-                            # ครั้งแรกของแชทนี้ - สร้าง thread ใหม่
-                            response = assistant.chat(messages=[msg])
-                            # เก็บ thread_id ไว้ใช้ครั้งต่อไป
-                            if hasattr(response, 'thread_id'):
-                                current_session["thread_id"] = response.thread_id
+                            deltas, shared = stream_assistant_reply(prompt, current_session, context), False
                         
-                        reply = response.message.content
-                    else:
-                        reply = "Error: Assistant not initialized."
-                except Exception as e:
-                    reply = f"Error: {str(e)}"
+                        # แสดงคำตอบทีละส่วนตามที่ได้รับจาก Pinecone
+                        with telemetry.span("assistant.coalesced" if shared else "assistant.chat"):
+                            start = time.perf_counter()
+                            for delta in deltas:
+                                if not reply:
+                                    telemetry.record("assistant.first_token",
+                                                     (time.perf_counter() - start) * 1000)
+                                reply += delta
+                                message_placeholder.markdown(reply + "▌")
+                        
+                        if cacheable and reply:
+                            answer_cache.put(prompt, version, reply)
+                else:
+                    reply = "Error: Assistant not initialized."
+                    failed = True
+            except Exception as e:
+                reply = f"Error: {str(e)}"
+                failed = True
+            
+            # โหมดสำรอง: Assistant ใช้ไม่ได้ ให้แสดงข้อความจากเอกสารที่เกี่ยวข้องแทน
+            if failed:
+                passages = search_local_documents(prompt)
+                if passages:
+                    reply = f"⚠️ {t('local_fallback')}\n\n{format_passages(passages)}"
             
-            # แสดงคำตอบใน placeholder หลังคิดเสร็จ
-            message_placeholder.write(reply)
+            # แสดงคำตอบฉบับเต็ม
+            message_placeholder.markdown(reply)
             
-        # Add AI Message
-        current_session["messages"].append({"role": "assistant", "content": reply})
+        # Add AI Message (คำตอบที่ล้มเหลวไม่ถูกส่งเป็น context ของคำถามถัดไป)
+        ai_message = {"role": "assistant", "content": reply}
+        if failed:
+            ai_message["_failed"] = True
+        current_session["messages"].append(ai_message)
 
         # Auto-rename if it's the first message and title is default
-        if len(current_session["messages"]) == 2 and current_session["title"] == t("new_chat"):
+        if len(current_session["messages"]) == 2 and not current_session.get("_has_older") \
+                and current_session["title"] == t("new_chat"):
             # Simple heuristic: use first few words of prompt
             new_title = " ".join(prompt.split()[:5])
             current_session["title"] = new_title
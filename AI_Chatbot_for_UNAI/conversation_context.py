@@ -0,0 +1,137 @@
+"""
+AI Chatbot for UNAI - Conversation Context
+สร้างรายการข้อความที่ส่งให้ Assistant จากประวัติแชทในเครื่อง ภายใต้งบประมาณ token
+- ส่งบทสนทนาล่าสุดแบบเต็ม (ไม่เกิน CONTEXT_RECENT_TURNS turn)
+- turn ที่เก่ากว่านั้นถูกย่อเป็นสรุปแบบ extractive (ประโยคแรกของคำถาม/คำตอบ) ต่อท้ายไปเรื่อยๆ
+  ถ้าสรุปยาวเกินงบ จะตัด turn ที่เก่าที่สุดออก
+ทำให้จำนวน token ต่อการถามหนึ่งครั้งคงที่ ไม่โตตามความยาวของแชท
+
+การนับ token เป็นค่าประมาณ (ไม่ต้องใช้ tokenizer): ภาษาไทย ~2 ตัวอักษรต่อ token, ภาษาอื่น ~4 ตัวอักษรต่อ token
+"""
+
+import hashlib
+import math
+import os
+import re
+from typing import Dict, List, Tuple
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000'))    # 0 = ปิด (ใช้ thread ของ Assistant)
+CONTEXT_RECENT_TURNS = int(os.getenv('CONTEXT_RECENT_TURNS', '6'))
+CONTEXT_SUMMARY_SHARE = float(os.getenv('CONTEXT_SUMMARY_SHARE', '0.25'))  # สัดส่วนงบที่ให้สรุป
+SUMMARY_LINE_CHARS = 160
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+_THAI = re.compile(r'[\u0e00-\u0e7f]')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s|\n')
+_WHITESPACE = re.compile(r'\s+')
+
+# ============================================================
+# Token Estimation
+# ============================================================
+
+def estimate_tokens(text: str) -> int:
+    """ประมาณจำนวน token ของข้อความ"""
+    thai = len(_THAI.findall(text))
+    return math.ceil(thai / 2 + (len(text) - thai) / 4)
+
+def message_tokens(message: Dict) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+# ============================================================
+# Summaries
+# ============================================================
+
+def split_turns(messages: List[Dict]) -> List[List[Dict]]:
+    """จัดกลุ่มข้อความเป็น turn (คำถามของผู้ใช้ + คำตอบที่ตามมา)"""
+    turns = []
+    for message in messages:
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+def lead_sentence(text: str, max_chars: int = SUMMARY_LINE_CHARS) -> str:
+    """ประโยคแรกของข้อความ (ตัดที่ช่องว่างถ้ายาวเกิน)"""
+    text = _SENTENCE_END.split(text.strip(), 1)[0]
+    text = _WHITESPACE.sub(' ', text).strip()
+    if len(text) > max_chars:
+        text = text[:max_chars].rsplit(' ', 1)[0] + " …"
+    return text
+
+def summarize_turn(turn: List[Dict]) -> str:
+    """ย่อหนึ่ง turn เหลือบรรทัดเดียว"""
+    parts = []
+    for message in turn:
+        label = "Q" if message["role"] == "user" else "A"
+        parts.append(f"{label}: {lead_sentence(message['content'])}")
+    return "- " + " / ".join(parts)
+
+def _fingerprint(turns: List[List[Dict]]) -> str:
+    last = turns[-1] if turns else []
+    return hashlib.md5("\x00".join(m["content"] for m in last).encode('utf-8')).hexdigest()
+
+def rolling_summary(older: List[List[Dict]], state: Dict, max_tokens: int) -> Tuple[List[str], int]:
+    """
+    สรุป turn เก่าต่อจากรอบก่อน (state เก็บไว้ใน session ระหว่าง rerun)
+    คืนค่า (บรรทัดสรุปที่อยู่ในงบ, จำนวน turn ที่ถูกตัดทิ้ง)
+    """
+    upto = state.get("upto", 0)
+    # ประวัติเปลี่ยน (เช่นโหลดข้อความเก่าเพิ่ม) ให้สรุปใหม่ทั้งหมด
+    if upto > len(older) or state.get("fingerprint") != _fingerprint(older[:upto]):
+        upto, state["lines"], state["dropped"] = 0, [], 0
+    lines = state.get("lines", []) + [summarize_turn(turn) for turn in older[upto:]]
+
+    # ตัดบรรทัดที่เก่าที่สุดทิ้งจนอยู่ในงบ (ไม่เก็บไว้ state จึงไม่โตตามความยาวของแชท)
+    total = sum(estimate_tokens(line) for line in lines)
+    while lines and total > max_tokens:
+        total -= estimate_tokens(lines.pop(0))
+        state["dropped"] = state.get("dropped", 0) + 1
+
+    state.update(lines=lines, upto=len(older), fingerprint=_fingerprint(older))
+    return list(lines), state.get("dropped", 0)
+
+# ============================================================
+# Context Assembly
+# ============================================================
+
+def build_context(messages: List[Dict], state: Dict, budget: int = CONTEXT_TOKEN_BUDGET,
+                  recent_turns: int = CONTEXT_RECENT_TURNS) -> Tuple[List[Dict], Dict]:
+    """
+    messages: ประวัติแชท โดยข้อความสุดท้ายคือคำถามปัจจุบัน
+    คืนค่า (ข้อความที่จะส่ง [{"role", "content"}], รายงานจำนวน token)
+    """
+    prompt = messages[-1]
+    turns = split_turns(messages[:-1])
+    remaining = budget - message_tokens(prompt)
+    summary_budget = int(budget * CONTEXT_SUMMARY_SHARE) if len(turns) > recent_turns else 0
+
+    # turn ล่าสุดแบบเต็ม (ใหม่ไปเก่า) จนกว่าจะครบจำนวนหรือเต็มงบ
+    recent = []
+    for turn in reversed(turns[-recent_turns:] if recent_turns > 0 else []):
+        cost = sum(message_tokens(m) for m in turn)
+        if cost > remaining - summary_budget:
+            break
+        recent.insert(0, turn)
+        remaining -= cost
+    older = turns[:len(turns) - len(recent)]
+
+    context = []
+    summary_lines, dropped = [], 0
+    if older:
+        header_tokens = estimate_tokens(SUMMARY_HEADER) + MESSAGE_OVERHEAD_TOKENS
+        summary_lines, dropped = rolling_summary(older, state, max(0, remaining - header_tokens))
+    if summary_lines:
+        context.append({"role": "user",
+                        "content": SUMMARY_HEADER + "\n" + "\n".join(summary_lines)})
+    context.extend(m for turn in recent for m in turn)
+    context.append(prompt)
+
+    report = {
+        "tokens": sum(message_tokens(m) for m in context),
+        "budget": budget,
+        "recent_turns": len(recent),
+        "summarized_turns": len(summary_lines),
+        "dropped_turns": dropped
+    }
+    return context, report
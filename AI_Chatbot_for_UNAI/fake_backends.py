@@ -0,0 +1,394 @@
+"""
+AI Chatbot for UNAI - Fake Backends
+Supabase / Pinecone Assistant / Google Drive จำลองแบบ in-process สำหรับ benchmark.py
+ตั้งค่า latency และอัตราการ error ได้ และนับจำนวนครั้งที่ถูกเรียก
+"""
+
+import copy
+import itertools
+import json
+import random
+import threading
+import time
+import types
+from collections import Counter
+from datetime import datetime, timedelta
+
+# ============================================================
+# Latency / Failure Model
+# ============================================================
+
+class BackendError(Exception):
+    """Error จำลองจาก backend"""
+
+class LatencyModel:
+    """หน่วงเวลาแบบ base + jitter (ms) และสุ่มให้ error ตาม failure_rate"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 failure_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def apply(self, operation: str):
+        with self._lock:
+            delay = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+            failed = self._random.random() < self.failure_rate
+            self.failures += failed
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if failed:
+            raise BackendError(f"simulated failure in {operation}")
+
+# ============================================================
+# Fake Supabase
+# ============================================================
+
+class _Query:
+    """จำลอง query builder ของ supabase-py เท่าที่แอปใช้"""
+
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.operation = "select"
+        self.payload = None
+        self.filters = []
+        self.orders = []
+        self.row_range = None
+        self.on_conflict = "id"
+        self.ignore_duplicates = False
+
+    def select(self, *columns, **kwargs):
+        self.operation = "select"
+        return self
+
+    def insert(self, payload, **kwargs):
+        self.operation, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict="", ignore_duplicates=False, **kwargs):
+        self.operation, self.payload = "upsert", payload
+        self.on_conflict, self.ignore_duplicates = on_conflict or "id", ignore_duplicates
+        return self
+
+    def update(self, payload, **kwargs):
+        self.operation, self.payload = "update", payload
+        return self
+
+    def delete(self, **kwargs):
+        self.operation = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        self.orders.append((column, desc))
+        return self
+
+    def range(self, start, end):
+        self.row_range = (start, end)
+        return self
+
+    def limit(self, count):
+        self.row_range = (0, count - 1)
+        return self
+
+    def execute(self):
+        self.client.latency.apply(f"{self.table}.{self.operation}")
+        self.client.calls[f"{self.table}.{self.operation}"] += 1
+        with self.client.lock:
+            data = getattr(self, f"_{self.operation}")()
+        return types.SimpleNamespace(data=data)
+
+    def _matches(self, row):
+        return all(f(row) for f in self.filters)
+
+    def _select(self):
+        rows = [r for r in self.client.tables[self.table] if self._matches(r)]
+        for column, desc in reversed(self.orders):
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        if self.row_range:
+            rows = rows[self.row_range[0]:self.row_range[1] + 1]
+        return copy.deepcopy(rows)
+
+    def _rows(self):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        return [self.client.with_defaults(self.table, dict(r)) for r in rows]
+
+    def _insert(self):
+        rows = self._rows()
+        self.client.tables[self.table].extend(rows)
+        if self.table == "chat_messages":
+            self.client.count_messages(rows, +1)
+        return copy.deepcopy(rows)
+
+    def _upsert(self):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        table = self.client.tables[self.table]
+        key = self.on_conflict
+        # NULL ไม่ชนกับแถวไหน (เหมือน unique index ของ Postgres)
+        existing = {r[key]: r for r in table if r.get(key) is not None}
+        result, inserted = [], []
+        for row in rows:
+            current = existing.get(row[key]) if row.get(key) is not None else None
+            if current is None:
+                inserted.append(self.client.with_defaults(self.table, dict(row)))
+                table.append(inserted[-1])
+                if row.get(key) is not None:
+                    existing[row[key]] = inserted[-1]
+                result.append(inserted[-1])
+            elif not self.ignore_duplicates:
+                current.update(row)
+                self.client.touch(current)
+                result.append(current)
+        if self.table == "chat_messages" and inserted:
+            self.client.count_messages(inserted, +1)
+        return copy.deepcopy(result)
+
+    def _update(self):
+        rows = [r for r in self.client.tables[self.table] if self._matches(r)]
+        for row in rows:
+            row.update(self.payload)
+            self.client.touch(row)
+        return copy.deepcopy(rows)
+
+    def _delete(self):
+        table = self.client.tables[self.table]
+        removed = [r for r in table if self._matches(r)]
+        self.client.tables[self.table] = [r for r in table if not self._matches(r)]
+        if self.table == "chat_messages":
+            self.client.count_messages(removed, -1)
+        # จำลอง ON DELETE CASCADE ของ chat_messages และ tombstone ของ delta sync
+        if self.table == "chat_sessions":
+            ids = {r["id"] for r in removed}
+            self.client.tables["chat_messages"] = [
+                m for m in self.client.tables["chat_messages"] if m["session_id"] not in ids
+            ]
+            self.client.tables["chat_session_deletions"].extend(
+                {"session_id": r["id"], "user_id": r["user_id"], "deleted_at": self.client.now()}
+                for r in removed
+            )
+        return copy.deepcopy(removed)
+
+class _RPC:
+    """จำลอง supabase.rpc(name, params): database function ทำงานใน transaction เดียว (เรียกครั้งเดียว)"""
+
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        self.client.latency.apply(f"rpc.{self.name}")
+        self.client.calls[f"rpc.{self.name}"] += 1
+        with self.client.lock:
+            data = getattr(self.client, f"_rpc_{self.name}")(**copy.deepcopy(self.params))
+        return types.SimpleNamespace(data=data)
+
+class FakeSupabase:
+    """Supabase client จำลอง เก็บตาราง chat_sessions / chat_messages ใน memory"""
+
+    def __init__(self, latency: LatencyModel = None):
+        self.latency = latency or LatencyModel()
+        self.tables = {"chat_sessions": [], "chat_messages": [], "chat_session_deletions": []}
+        self.calls = Counter()
+        self.lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self._clock = datetime(2024, 1, 1)
+
+    def now(self) -> str:
+        """เวลาที่เพิ่มขึ้นทีละ 1ms เพื่อให้เรียงลำดับได้แน่นอน"""
+        self._clock += timedelta(milliseconds=1)
+        return self._clock.isoformat()
+
+    def with_defaults(self, table, row):
+        row.setdefault("created_at", self.now())
+        if table == "chat_messages":
+            row.setdefault("id", next(self._ids))
+        if table == "chat_sessions":
+            row.setdefault("updated_at", self.now())
+            row.setdefault("message_count", 0)
+        return row
+
+    def touch(self, session):
+        """จำลอง trigger ที่อัปเดต updated_at ของ chat_sessions"""
+        if "updated_at" in session:
+            session["updated_at"] = self.now()
+
+    def count_messages(self, messages, sign):
+        """จำลอง trigger ที่นับ message_count ของแชท"""
+        counts = Counter(m["session_id"] for m in messages)
+        for session in self.tables["chat_sessions"]:
+            if session["id"] in counts:
+                session["message_count"] = max(0, session.get("message_count", 0) + sign * counts[session["id"]])
+                self.touch(session)
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params=None):
+        return _RPC(self, name, params or {})
+
+    def _rpc_save_chat_changes(self, p_changes):
+        """เหมือน save_chat_changes ใน supabase/migrations/20261018000400_chat_message_client_id.sql"""
+        inserted = 0
+        # ส่งผ่าน JSON เหมือน PostgREST (None กลายเป็น JSON null)
+        for change in json.loads(json.dumps(p_changes)):
+            session_id = change["session_id"]
+            # jsonb_populate_record(coalesce(nullif(meta, 'null'), '{}') || {...}) ต้องได้ object
+            meta = change.get("meta")
+            if meta is not None and not isinstance(meta, dict):
+                raise BackendError("cannot call jsonb_populate_record on a non-object")
+            if change.get("delete"):
+                self.table("chat_sessions").delete().eq("id", session_id)._delete()
+                continue
+            # jsonb_typeof(meta) = 'object' (รวมถึง {} ที่ Python ถือว่าเป็นเท็จ)
+            if isinstance(meta, dict):
+                self.table("chat_sessions").upsert(
+                    {"id": session_id, "user_id": change["user_id"], **meta}
+                )._upsert()
+            if change.get("rewrite"):
+                self.table("chat_messages").delete().eq("session_id", session_id)._delete()
+            if change.get("messages"):
+                inserted += len(self.table("chat_messages").upsert(
+                    [{"session_id": session_id, **msg} for msg in change["messages"]],
+                    on_conflict="client_id", ignore_duplicates=True
+                )._upsert())
+        return inserted
+
+    def seed(self, users: int, sessions: int, messages: int):
+        """สร้างข้อมูลตัวอย่าง: users × sessions × messages"""
+        for u in range(users):
+            for s in range(sessions):
+                session_id = f"u{u}-s{s}"
+                self.tables["chat_sessions"].append(self.with_defaults("chat_sessions", {
+                    "id": session_id,
+                    "user_id": f"user-{u}",
+                    "title": f"Chat {s}",
+                    "thread_id": None,
+                    "message_count": messages
+                }))
+                for m in range(messages):
+                    self.tables["chat_messages"].append(self.with_defaults("chat_messages", {
+                        "session_id": session_id,
+                        "role": "user" if m % 2 == 0 else "assistant",
+                        "content": f"message {m} " * 20
+                    }))
+
+# ============================================================
+# Fake Pinecone Assistant
+# ============================================================
+
+class FakeAssistant:
+    """
+    Assistant จำลอง: latency = เวลาจนได้ token แรก, token_latency = เวลาต่อ token
+    ถ้า stream=True จะ yield chunk รูปแบบเดียวกับ pinecone-plugin-assistant
+    """
+
+    name = "fake-assistant"
+
+    def __init__(self, latency: LatencyModel = None, token_latency_ms: float = 0.0,
+                 reply_tokens: int = 50):
+        self.latency = latency or LatencyModel()
+        self.token_latency_ms = token_latency_ms
+        self.reply_tokens = reply_tokens
+        self.calls = Counter()
+        self.files = []
+
+    def _reply(self, messages):
+        question = messages[-1].content if messages else ""
+        return [f"ans{i}({question[:10]}) " for i in range(self.reply_tokens)]
+
+    def chat(self, messages, stream=False, **kwargs):
+        self.calls["chat.stream" if stream else "chat"] += 1
+        self.latency.apply("assistant.chat")
+        tokens = self._reply(messages)
+        if stream:
+            return self._stream(tokens)
+        if self.token_latency_ms:
+            time.sleep(self.token_latency_ms * len(tokens) / 1000)
+        message = types.SimpleNamespace(role="assistant", content="".join(tokens))
+        return types.SimpleNamespace(message=message, citations=[])
+
+    def _stream(self, tokens):
+        yield types.SimpleNamespace(type="message_start", role="assistant")
+        for token in tokens:
+            if self.token_latency_ms:
+                time.sleep(self.token_latency_ms / 1000)
+            yield types.SimpleNamespace(type="content_chunk",
+                                        delta=types.SimpleNamespace(content=token))
+        yield types.SimpleNamespace(type="message_end", finish_reason="stop")
+
+    def list_files(self, **kwargs):
+        self.calls["list_files"] += 1
+        return list(self.files)
+
+# ============================================================
+# Fake Google Drive / Files API (upload pipeline)
+# ============================================================
+
+class FakeHTTPResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self.headers = {}
+        self._payload = payload or {}
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+class FakeFilesSession:
+    """แทน requests.Session ของ upload: ตอบ 429 ตาม failure_rate ของ latency model"""
+
+    def __init__(self, latency: LatencyModel = None):
+        self.latency = latency or LatencyModel()
+        self.calls = Counter()
+        self.files = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def post(self, url, files=None, **kwargs):
+        self.calls["files.post"] += 1
+        try:
+            self.latency.apply("files.post")
+        except BackendError:
+            return FakeHTTPResponse(429)
+        info = {"id": f"file-{next(self._ids)}", "name": files["file"][0] if files else None,
+                "status": "Processing"}
+        with self._lock:
+            self.files.append(info)
+        return FakeHTTPResponse(200, dict(info))
+
+    def get(self, url, **kwargs):
+        self.calls["files.get"] += 1
+        with self._lock:
+            return FakeHTTPResponse(200, {"files": [dict(f) for f in self.files]})
+
+    def close(self):
+        pass
+
+def fake_drive_download(latency: LatencyModel, size_bytes: int):
+    """ฟังก์ชันแทน upload_documents.download_document"""
+    def download_document(drive_service, item, fh):
+        latency.apply("drive.download")
+        fh.write(b"%PDF" + b"0" * (size_bytes - 4))
+        fh.seek(0)
+    return download_document
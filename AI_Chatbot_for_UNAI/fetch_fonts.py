@@ -0,0 +1,65 @@
+"""
+ดาวน์โหลดฟอนต์ Inter / Sarabun มาเก็บไว้ใน static/fonts
+เพื่อให้หน้าเว็บไม่ต้องรอ Google Fonts ตอนโหลดครั้งแรก
+(รันครั้งเดียวแล้ว commit ไฟล์ใน static/fonts ได้เลย)
+"""
+
+import os
+import re
+import requests
+
+FONTS_URL = "https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&family=Sarabun:wght@400;500;600&display=swap"
+FONT_SUBSETS = {"latin", "latin-ext", "thai"}
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "fonts")
+STATIC_URL = "app/static/fonts"
+
+# ต้องส่ง User-Agent ของ browser ใหม่ๆ ไม่อย่างนั้น Google จะตอบเป็น .ttf แทน .woff2
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+)
+
+def fetch_fonts():
+    """ดาวน์โหลดไฟล์ .woff2 และเขียน fonts.css ที่ชี้ไปยังไฟล์ local"""
+    os.makedirs(FONTS_DIR, exist_ok=True)
+    response = requests.get(FONTS_URL, headers={"User-Agent": USER_AGENT}, timeout=30)
+    response.raise_for_status()
+    
+    # Google ใส่ comment /* subset */ ไว้หน้า @font-face แต่ละอัน
+    blocks = re.findall(r"/\*\s*([\w-]+)\s*\*/\s*(@font-face\s*{[^}]*})", response.text)
+    downloaded = {}
+    font_faces = []
+    
+    for subset, block in blocks:
+        if subset not in FONT_SUBSETS:
+            continue
+        
+        family = re.search(r"font-family:\s*'([^']+)'", block).group(1)
+        weight = re.search(r"font-weight:\s*(\d+)", block).group(1)
+        url = re.search(r"url\((https://[^)]+)\)", block).group(1)
+        
+        # Inter เป็น variable font: หลาย weight ใช้ไฟล์เดียวกัน
+        if url not in downloaded:
+            filename = f"{family.lower()}-{subset}-{weight}.woff2"
+            print(f"⬇️  {filename}")
+            font = requests.get(url, timeout=30)
+            font.raise_for_status()
+            with open(os.path.join(FONTS_DIR, filename), 'wb') as f:
+                f.write(font.content)
+            downloaded[url] = filename
+        
+        font_faces.append(block.replace(url, f"{STATIC_URL}/{downloaded[url]}"))
+    
+    with open(os.path.join(FONTS_DIR, "fonts.css"), 'w', encoding='utf-8') as f:
+        f.write("\n".join(font_faces) + "\n")
+    
+    print(f"\n✅ Saved {len(downloaded)} font file(s) to {FONTS_DIR}")
+
+if __name__ == "__main__":
+    print("============================================================")
+    print("🔤 Fetch Local Fonts (Inter / Sarabun)")
+    print("============================================================\n")
+    try:
+        fetch_fonts()
+    except Exception as e:
+        print(f"❌ Error fetching fonts: {str(e)}")
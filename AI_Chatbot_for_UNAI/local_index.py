@@ -0,0 +1,295 @@
+"""
+AI Chatbot for UNAI - Local Retrieval Index
+ดัชนีค้นหาเอกสารแบบ BM25 บนเครื่อง (NumPy) สร้างตอน upload_documents.py
+- ตอบคำถามแนว "เอกสารไหนพูดถึงเรื่อง X" ได้ในระดับมิลลิวินาที (พิมพ์ /docs <คำค้น> ในแชท)
+- ใช้เป็นโหมดสำรองเมื่อเรียก Pinecone Assistant ไม่ได้
+
+ภาษาไทยไม่มีเว้นวรรคระหว่างคำ จึงตัดเป็น bigram ของตัวอักษร (ไม่ต้องใช้พจนานุกรม)
+ส่วนภาษาอังกฤษ/ตัวเลขตัดตามคำ
+
+ต้องติดตั้ง numpy และ pypdf (ถ้าไม่มี ระบบจะข้ามการสร้าง/ใช้ดัชนีนี้ไป)
+
+ตัวอย่าง:
+    python local_index.py "ค่าเทอม"
+"""
+
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+LOCAL_INDEX_PATH = os.getenv('LOCAL_INDEX', 'local_index.npz')
+CHUNK_CHARS = int(os.getenv('LOCAL_INDEX_CHUNK_CHARS', '800'))
+CHUNK_OVERLAP = int(os.getenv('LOCAL_INDEX_CHUNK_OVERLAP', '150'))
+INDEX_VERSION = 1
+
+# พารามิเตอร์มาตรฐานของ BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_THAI = re.compile(r'[\u0e00-\u0e7f]+')
+_TOKEN = re.compile(r'[\u0e00-\u0e7f]+|[^\W_\u0e00-\u0e7f]+')
+_WHITESPACE = re.compile(r'\s+')
+
+def is_available() -> bool:
+    """ติดตั้ง dependency ครบหรือไม่"""
+    return np is not None and PdfReader is not None
+
+# ============================================================
+# Text Processing
+# ============================================================
+
+def tokenize(text: str) -> List[str]:
+    """ตัดคำ: ภาษาไทยเป็น bigram ของตัวอักษร, ภาษาอื่นตามคำ (ไม่สนตัวพิมพ์เล็ก/ใหญ่)"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    tokens = []
+    for run in _TOKEN.findall(text):
+        if _THAI.fullmatch(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+def extract_pdf_pages(fh) -> List[str]:
+    """ดึงข้อความของแต่ละหน้าจากไฟล์ PDF (file object หรือ bytes)"""
+    if isinstance(fh, (bytes, bytearray)):
+        fh = io.BytesIO(fh)
+    fh.seek(0)
+    reader = PdfReader(fh)
+    return [page.extract_text() or "" for page in reader.pages]
+
+def chunk_pages(doc_id: str, name: str, pages: List[str],
+                size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[Dict]:
+    """แบ่งข้อความแต่ละหน้าเป็นช่วงๆ ที่ซ้อนกันเล็กน้อย (ตัดที่ช่องว่างถ้าทำได้)"""
+    chunks = []
+    for page_number, text in enumerate(pages, 1):
+        text = _WHITESPACE.sub(' ', text).strip()
+        start = 0
+        while start < len(text):
+            end = min(len(text), start + size)
+            if end < len(text):
+                space = text.rfind(' ', start + size // 2, end)
+                end = space if space > 0 else end
+            chunks.append({"doc_id": doc_id, "document": name, "page": page_number,
+                           "text": text[start:end].strip()})
+            if end >= len(text):
+                break
+            start = max(end - overlap, start + 1)
+    return [chunk for chunk in chunks if chunk["text"]]
+
+class ChunkSpool:
+    """
+    พัก chunk ของเอกสารที่ดึงข้อความแล้วลงไฟล์ชั่วคราว (JSONL) ทันทีที่แต่ละไฟล์เสร็จ
+    ข้อความของทั้ง folder จึงไม่ค้างอยู่ใน memory ระหว่างดาวน์โหลด/upload (thread-safe)
+    """
+
+    def __init__(self):
+        self.doc_ids = set()
+        self._file = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def add(self, doc_id: str, name: str, pages: List[str]):
+        lines = [json.dumps(chunk, ensure_ascii=False) + "\n" for chunk in chunk_pages(doc_id, name, pages)]
+        with self._lock:
+            self._file.writelines(lines)
+            self.doc_ids.add(doc_id)
+
+    def chunks(self) -> Iterable[Dict]:
+        """อ่าน chunk ทั้งหมดกลับมา (เรียกหลังทุก worker ทำงานเสร็จแล้ว)"""
+        with self._lock:
+            self._file.flush()
+            self._file.seek(0)
+            for line in self._file:
+                yield json.loads(line)
+
+    def close(self):
+        self._file.close()
+
+# ============================================================
+# BM25 Index
+# ============================================================
+
+class LocalIndex:
+    """
+    inverted index แบบ CSR: postings ของ term t อยู่ที่ indices/tf[indptr[t]:indptr[t + 1]]
+    """
+
+    def __init__(self, chunks: List[Dict], vocab: Dict[str, int], indptr, indices, tf, doc_len):
+        self.chunks = chunks
+        self.vocab = vocab
+        self.indptr = indptr
+        self.indices = indices
+        self.tf = tf
+        self.doc_len = doc_len
+        self.avg_len = float(doc_len.mean()) if len(doc_len) else 0.0
+        df = np.diff(indptr).astype(np.float64)
+        self.idf = np.log1p((len(chunks) - df + 0.5) / (df + 0.5))
+
+    @classmethod
+    def build(cls, chunks: List[Dict]) -> "LocalIndex":
+        vocab = {}
+        terms, chunk_ids, counts = [], [], []
+        doc_len = np.zeros(len(chunks), dtype=np.float32)
+
+        for chunk_id, chunk in enumerate(chunks):
+            term_counts = Counter(tokenize(chunk["text"]))
+            doc_len[chunk_id] = sum(term_counts.values())
+            for term, count in term_counts.items():
+                terms.append(vocab.setdefault(term, len(vocab)))
+                chunk_ids.append(chunk_id)
+                counts.append(count)
+
+        terms = np.asarray(terms, dtype=np.int64)
+        order = np.argsort(terms, kind="stable")
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocab)), out=indptr[1:])
+        return cls(chunks, vocab, indptr,
+                   np.asarray(chunk_ids, dtype=np.int32)[order],
+                   np.asarray(counts, dtype=np.float32)[order],
+                   doc_len)
+
+    # ---------- Persistence ----------
+
+    def save(self, path: str = LOCAL_INDEX_PATH):
+        """บันทึกเป็นไฟล์ .npz ไฟล์เดียว (เขียนไฟล์ชั่วคราวแล้ว rename)"""
+        terms = sorted(self.vocab, key=self.vocab.get)
+        meta = json.dumps({"version": INDEX_VERSION, "terms": terms, "chunks": self.chunks},
+                          ensure_ascii=False).encode('utf-8')
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, indptr=self.indptr, indices=self.indices, tf=self.tf,
+                 doc_len=self.doc_len, meta=np.frombuffer(meta, dtype=np.uint8))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = LOCAL_INDEX_PATH) -> Optional["LocalIndex"]:
+        if np is None or not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes().decode('utf-8'))
+            if meta.get("version") != INDEX_VERSION:
+                return None
+            vocab = {term: i for i, term in enumerate(meta["terms"])}
+            return cls(meta["chunks"], vocab, data["indptr"], data["indices"],
+                       data["tf"], data["doc_len"])
+
+    # ---------- Search ----------
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict]:
+        """คืน passage ที่ตรงกับคำค้นมากที่สุด พร้อมคะแนน BM25"""
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids or not self.chunks:
+            return []
+
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len / max(self.avg_len, 1.0))
+        for term_id in term_ids:
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            chunk_ids = self.indices[start:end]
+            tf = self.tf[start:end]
+            scores[chunk_ids] += self.idf[term_id] * tf * (BM25_K1 + 1) / (tf + length_norm[chunk_ids])
+
+        top_k = min(top_k, int(np.count_nonzero(scores)))
+        if top_k == 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [{**self.chunks[i], "score": float(scores[i])} for i in best]
+
+    def search_documents(self, query: str, top_k: int = 3) -> List[Dict]:
+        """ตอบว่าเอกสารไหนเกี่ยวข้องที่สุด (passage ที่ดีที่สุดของแต่ละเอกสาร)"""
+        documents = {}
+        for passage in self.search(query, top_k=top_k * 5):
+            documents.setdefault(passage["doc_id"], passage)
+        return list(documents.values())[:top_k]
+
+    def document_ids(self) -> set:
+        return {chunk["doc_id"] for chunk in self.chunks}
+
+# ============================================================
+# Functions
+# ============================================================
+
+_loaded = {}
+
+def get_index(path: str = LOCAL_INDEX_PATH) -> Optional[LocalIndex]:
+    """โหลดดัชนีครั้งเดียวต่อ process และโหลดใหม่อัตโนมัติเมื่อไฟล์ถูกสร้างใหม่"""
+    if np is None:
+        return None
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _loaded[path] = (mtime, LocalIndex.load(path))
+    return cached[1]
+
+def update_index(spool: ChunkSpool, removed_ids: Iterable[str] = (),
+                 replace: bool = False, path: str = LOCAL_INDEX_PATH) -> Optional[LocalIndex]:
+    """
+    อัปเดตดัชนีด้วยเอกสารที่เพิ่ง upload
+    spool: chunk ของเอกสารที่ดึงข้อความได้ (ChunkSpool)
+    removed_ids: เอกสารที่ถูกลบ / replace=True: สร้างใหม่จากเอกสารชุดนี้เท่านั้น
+    """
+    existing = None if replace else LocalIndex.load(path)
+    dropped = set(removed_ids) | spool.doc_ids
+    chunks = [c for c in (existing.chunks if existing else []) if c["doc_id"] not in dropped]
+    chunks.extend(spool.chunks())
+
+    index = LocalIndex.build(chunks)
+    index.save(path)
+    return index
+
+def format_passages(passages: List[Dict], max_chars: int = 300) -> str:
+    """แสดงผลการค้นหาเป็น markdown (ชื่อเอกสาร, หน้า, ข้อความที่เกี่ยวข้อง)"""
+    lines = []
+    for passage in passages:
+        text = passage["text"]
+        if len(text) > max_chars:
+            text = text[:max_chars].rsplit(' ', 1)[0] + " …"
+        lines.append(f"**📄 {passage['document']}** (p. {passage['page']})\n\n> {text}")
+    return "\n\n".join(lines)
+
+# ============================================================
+# Main Function
+# ============================================================
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    if not args:
+        print("Usage: python local_index.py <query>")
+        return
+    if np is None:
+        print("❌ numpy is not installed")
+        return
+
+    index = LocalIndex.load()
+    if index is None:
+        print(f"❌ Local index not found: {LOCAL_INDEX_PATH} (run upload_documents.py first)")
+        return
+
+    start = time.perf_counter()
+    passages = index.search_documents(" ".join(args))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(format_passages(passages) if passages else "⚠️  No matching documents")
+    print(f"\n⏱️  {elapsed_ms:.1f} ms over {len(index.chunks)} passage(s)")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,21 @@
 import os
 import streamlit as st
 from pinecone import Pinecone
+from pinecone_plugins.assistant.models.chat import Message
 from dotenv import load_dotenv
 import hashlib
-from datetime import datetime
+import html
+import re
+from datetime import datetime, timedelta
 import time
+import uuid
 from supabase import create_client, Client
+from answer_cache import AnswerCache, SingleFlight, get_corpus_version
+from telemetry import timed, record, mark_error
+from write_behind import WriteBehindQueue
+from local_index import get_index
+from conversation_context import CONTEXT_TOKEN_BUDGET, build_context
+from shared_cache import create_cache_backend
 
 load_dotenv()
 
@@ -43,6 +53,12 @@ TRANSLATIONS = {
     "save": {"th": "บันทึก", "en": "Save"},
     "cancel": {"th": "ยกเลิก", "en": "Cancel"},
     "logout": {"th": "ออกจากระบบ", "en": "Logout"},
+    "message_results": {"th": "พบในข้อความ", "en": "Found in messages"},
+    "no_results": {"th": "ไม่พบข้อความที่ตรงกัน", "en": "No matching messages"},
+    "load_older": {"th": "ดูข้อความก่อนหน้า", "en": "Load older messages"},
+    "local_fallback": {"th": "ระบบตอบคำถามไม่พร้อมใช้งานชั่วคราว ด้านล่างคือข้อความจากเอกสารที่เกี่ยวข้อง", "en": "The assistant is temporarily unavailable. Here are related passages from the documents."},
+    "no_documents": {"th": "ไม่พบเอกสารที่เกี่ยวข้อง", "en": "No related documents found"},
+    "local_index_missing": {"th": "ยังไม่มีดัชนีเอกสารบนเครื่อง (รัน upload_documents.py ก่อน)", "en": "No local document index yet (run upload_documents.py first)"},
 }
 
 def t(key):
@@ -52,95 +68,438 @@ def t(key):
 # Database Functions
 # ============================================================
 
-def save_session_to_db(session_id, session_data):
-    """บันทึกแชทลง Supabase"""
-    try:
-        user_id = st.session_state.user.id
-        
-        # 1. บันทึก/อัพเดต session
-        session_row = {
-            "id": session_id,
-            "user_id": user_id,
-            "title": session_data.get("title", "New Chat"),
-            "thread_id": session_data.get("thread_id"),
-            "created_at": session_data.get("created_at")
+def _session_meta(session_data):
+    """ข้อมูลหัวแชทที่เก็บในตาราง chat_sessions"""
+    return {
+        "title": session_data.get("title", "New Chat"),
+        "thread_id": session_data.get("thread_id"),
+        "created_at": session_data.get("created_at")
+    }
+
+def mark_session_saved(session_data):
+    """จำว่าข้อมูลใน session_data ตรงกับใน database แล้ว (ใช้หลังโหลดจาก DB)"""
+    session_data["_saved_meta"] = _session_meta(session_data)
+    session_data["_saved_count"] = len(session_data.get("messages") or [])
+    return session_data
+
+# บันทึกผ่าน database function save_chat_changes (transaction เดียว, เรียกครั้งเดียว)
+# ต้องใช้ migration 20261018000300_save_chat_changes.sql และ 20261018000400_chat_message_client_id.sql, ตั้ง SAVE_RPC=0 เพื่อใช้ REST หลายครั้งแบบเดิม
+SAVE_RPC = os.getenv("SAVE_RPC", "1") == "1"
+
+@timed("db.write_changes")
+def write_session_changes(changes):
+    """เขียนการเปลี่ยนแปลงของหลายแชทลง Supabase ในครั้งเดียว (เรียกจาก write-behind queue)"""
+    if SAVE_RPC:
+        write_session_changes_rpc(changes)
+    else:
+        write_session_changes_rest(changes)
+    
+    # ให้ทุก replica เลิกใช้แคชแชทของผู้ใช้เหล่านี้ (หลังเขียนสำเร็จแล้วเท่านั้น)
+    invalidate_user_sessions(c["user_id"] for c in changes)
+
+def write_session_changes_rpc(changes):
+    """ทั้ง batch อยู่ใน transaction เดียว: สำเร็จทั้งหมดหรือไม่เขียนอะไรเลย"""
+    supabase.rpc("save_chat_changes", {"p_changes": changes}).execute()
+
+def write_session_changes_rest(changes):
+    """
+    แบบเดิมผ่าน REST (ไม่เป็น transaction)
+    ลำดับ: ลบแชท → upsert หัวแชท → ลบข้อความของแชทที่เขียนใหม่ทั้งหมด → insert ข้อความใหม่
+    ข้อความใหม่ insert แบบ on conflict (client_id) do nothing: ถ้า batch ล้มเหลวหลัง insert ไปบางหน้าแล้ว
+    การ retry ทั้ง batch จะไม่ได้ข้อความซ้ำ (ต้องใช้ migration 20261018000400_chat_message_client_id.sql)
+    """
+    deleted = [c["session_id"] for c in changes if c.get("delete")]
+    if deleted:
+        supabase.table("chat_sessions").delete().in_("id", deleted).execute()
+    
+    session_rows = [
+        {"id": c["session_id"], "user_id": c["user_id"], **c["meta"]}
+        for c in changes if c.get("meta") and not c.get("delete")
+    ]
+    if session_rows:
+        supabase.table("chat_sessions").upsert(session_rows).execute()
+    
+    rewritten = [c["session_id"] for c in changes if c.get("rewrite") and not c.get("delete")]
+    if rewritten:
+        supabase.table("chat_messages").delete().in_("session_id", rewritten).execute()
+    
+    messages_to_insert = [
+        {
+            "session_id": c["session_id"],
+            "role": msg["role"],
+            "content": msg["content"],
+            "client_id": msg.get("client_id")
         }
+        for c in changes if not c.get("delete")
+        for msg in c.get("messages", [])
+    ]
+    for start in range(0, len(messages_to_insert), MESSAGES_PAGE_SIZE):
+        supabase.table("chat_messages") \
+            .upsert(messages_to_insert[start:start + MESSAGES_PAGE_SIZE],
+                    on_conflict="client_id", ignore_duplicates=True) \
+            .execute()
+
+def submit_session_change(change):
+    """ส่งการเปลี่ยนแปลงเข้า write-behind queue (หรือเขียนทันทีถ้าปิด WRITE_BEHIND)"""
+    if write_queue is not None:
+        write_queue.submit(change)
+    else:
+        write_session_changes([change])
+    clear_search_cache()
+
+def flush_pending_writes():
+    """รอให้ write-behind queue เขียนที่ค้างอยู่ของผู้ใช้คนนี้ก่อนอ่านจาก database (ให้เห็นข้อมูลล่าสุดของตัวเอง)"""
+    if write_queue is not None and not write_queue.flush(WRITE_READ_TIMEOUT, user_id=st.session_state.user.id):
+        st.warning("Some chat changes are still waiting to be saved to the database.")
+        return False
+    return True
+
+@timed("db.save_session")
+def save_session_to_db(session_id, session_data, full=False):
+    """
+    บันทึกแชทลง Supabase แบบ append-only ผ่าน write-behind queue
+    - upsert หัวแชทเฉพาะเมื่อ title/thread_id เปลี่ยน
+    - insert เฉพาะข้อความใหม่ที่ยังไม่เคยบันทึก
+    full=True จะลบข้อความทั้งหมดแล้วเขียนใหม่ (แบบเดิม)
+    """
+    try:
+        meta = _session_meta(session_data)
+        messages = session_data.get("messages") or []
+        saved_count = 0 if full else session_data.get("_saved_count", 0)
+        rewrite = full or saved_count > len(messages)
         
-        # Upsert (Insert or Update)
-        supabase.table("chat_sessions").upsert(session_row).execute()
-        
-        # 2. ลบข้อความเก่าก่อน (เพื่อความง่าย)
-        supabase.table("chat_messages").delete().eq("session_id", session_id).execute()
+        # แชทที่ยังโหลดข้อความเก่าไม่ครบ ต้องโหลดให้ครบก่อนเขียนใหม่ ไม่อย่างนั้นข้อความที่ไม่ได้โหลดจะหายไป
+        if rewrite:
+            while session_data.get("_has_older"):
+                if not load_older_messages(session_id, MESSAGES_PAGE_SIZE):
+                    raise RuntimeError("could not load older messages before rewriting")
+            saved_count = 0
         
-        # 3. Insert ข้อความใหม่
-        if session_data.get("messages"):
-            messages_to_insert = [
-                {
-                    "session_id": session_id,
-                    "role": msg["role"],
-                    "content": msg["content"]
-                }
-                for msg in session_data["messages"]
-            ]
-            supabase.table("chat_messages").insert(messages_to_insert).execute()
+        change = {
+            "session_id": session_id,
+            "user_id": st.session_state.user.id,
+            # 1. หัวแชท (เฉพาะเมื่อเปลี่ยน)
+            "meta": meta if full or session_data.get("_saved_meta") != meta else None,
+            # 2. ลบข้อความเดิมทั้งหมดก่อน (ถ้าประวัติสั้นลงกว่าที่บันทึกไว้)
+            "rewrite": rewrite,
+            # 3. เฉพาะข้อความใหม่ (client_id สร้างครั้งเดียวและเก็บใน journal จึง retry/replay ได้โดยไม่ซ้ำ)
+            "messages": [
+                {"role": m["role"], "content": m["content"], "client_id": str(uuid.uuid4())}
+                for m in messages[saved_count:]
+            ],
+            "delete": False
+        }
+        if change["meta"] or change["rewrite"] or change["messages"]:
+            submit_session_change(change)
         
+        session_data["_saved_meta"] = meta
+        session_data["_saved_count"] = len(messages)
+        # จำนวนข้อความใน database หลังเขียนเสร็จ (ใช้เทียบกับ message_count ตอน sync)
+        session_data["_message_count"] = len(messages) if rewrite \
+            else session_data.get("_message_count", 0) + len(change["messages"])
         return True
     except Exception as e:
+        mark_error()
         st.error(f"Error saving to database: {str(e)}")
         return False
 
+# จำนวน session ต่อหนึ่ง query (กัน URL ยาวเกิน) และจำนวนแถวต่อหน้า (PostgREST จำกัด 1000)
+MESSAGES_BATCH_SESSIONS = 100
+MESSAGES_PAGE_SIZE = 1000
+
+@timed("db.load_messages")
+def load_messages_for_sessions(session_ids):
+    """โหลดข้อความของหลาย session ในครั้งเดียว แล้วจัดกลุ่มตาม session_id"""
+    grouped = {sid: [] for sid in session_ids}
+    session_ids = list(session_ids)
+    
+    for start in range(0, len(session_ids), MESSAGES_BATCH_SESSIONS):
+        batch = session_ids[start:start + MESSAGES_BATCH_SESSIONS]
+        offset = 0
+        while True:
+            response = supabase.table("chat_messages") \
+                .select("session_id, role, content, created_at") \
+                .in_("session_id", batch) \
+                .order("created_at") \
+                .order("id") \
+                .range(offset, offset + MESSAGES_PAGE_SIZE - 1) \
+                .execute()
+            
+            for msg in response.data:
+                grouped[msg["session_id"]].append({
+                    "role": msg["role"],
+                    "content": msg["content"]
+                })
+            
+            if len(response.data) < MESSAGES_PAGE_SIZE:
+                break
+            offset += MESSAGES_PAGE_SIZE
+    
+    return grouped
+
+@timed("db.load_sessions")
 def load_sessions_from_db():
-    """โหลดแชททั้งหมดจาก Supabase"""
+    """โหลดแชททั้งหมดจาก Supabase (หัวแชท 1 query + ข้อความแบบ batch)"""
     try:
+        flush_pending_writes()
         user_id = st.session_state.user.id
         
-        # 1. โหลด sessions
-        response = supabase.table("chat_sessions") \
-            .select("*") \
-            .eq("user_id", user_id) \
-            .order("created_at", desc=True) \
-            .execute()
-        
-        sessions = {}
-        for session in response.data:
-            session_id = session["id"]
-            
-            # 2. โหลดข้อความของแต่ละ session
-            messages_response = supabase.table("chat_messages") \
+        def fetch():
+            # 1. โหลด sessions
+            response = supabase.table("chat_sessions") \
                 .select("*") \
-                .eq("session_id", session_id) \
-                .order("created_at") \
+                .eq("user_id", user_id) \
+                .order("created_at", desc=True) \
                 .execute()
             
-            messages = [
-                {
-                    "role": msg["role"],
-                    "content": msg["content"]
-                }
-                for msg in messages_response.data
-            ]
-            
-            sessions[session_id] = {
+            # 2. โหลดข้อความของทุก session พร้อมกัน
+            messages = load_messages_for_sessions([session["id"] for session in response.data])
+            return {"sessions": response.data, "messages": messages}
+        
+        data = cached_for_user(user_id, "full", fetch)
+        messages_by_session = data["messages"]
+        
+        sessions = {}
+        for session in data["sessions"]:
+            session_id = session["id"]
+            sessions[session_id] = mark_session_saved({
                 "title": session["title"],
                 "thread_id": session["thread_id"],
                 "created_at": session["created_at"],
-                "messages": messages
-            }
+                "messages": messages_by_session[session_id],
+                "_message_count": session["message_count"]
+            })
         
+        set_sync_watermark(data["sessions"])
         return sessions
     except Exception as e:
+        mark_error()
         st.error(f"Error loading from database: {str(e)}")
         return {}
 
+SESSION_HEADER_COLUMNS = "id, title, thread_id, created_at, updated_at, message_count"
+
+@timed("db.load_session_headers")
+def load_session_headers_from_db():
+    """โหลดเฉพาะหัวแชท (title, created_at) ข้อความจะโหลดเมื่อเปิดแชทนั้น"""
+    try:
+        flush_pending_writes()
+        user_id = st.session_state.user.id
+        
+        def fetch():
+            return supabase.table("chat_sessions") \
+                .select(SESSION_HEADER_COLUMNS) \
+                .eq("user_id", user_id) \
+                .order("created_at", desc=True) \
+                .execute().data
+        
+        rows = cached_for_user(user_id, "headers", fetch)
+        
+        sessions = {}
+        for session in rows:
+            sessions[session["id"]] = mark_session_saved({
+                "title": session["title"],
+                "thread_id": session["thread_id"],
+                "created_at": session["created_at"],
+                "messages": [],
+                "_messages_loaded": False,
+                "_message_count": session["message_count"]
+            })
+        
+        set_sync_watermark(rows)
+        return sessions
+    except Exception as e:
+        mark_error()
+        st.error(f"Error loading from database: {str(e)}")
+        return {}
+
+# จำนวนข้อความล่าสุดที่โหลด/แสดงต่อหนึ่งหน้า (กด "ดูข้อความก่อนหน้า" เพื่อโหลดเพิ่มทีละหน้า)
+MESSAGE_WINDOW = int(os.getenv("MESSAGE_WINDOW", "30"))
+
+@timed("db.load_recent_messages")
+def load_recent_messages(session_id, limit, offset=0):
+    """
+    โหลดข้อความล่าสุดของแชท ข้ามข้อความใหม่สุด offset ข้อความ
+    คืนค่า (ข้อความเรียงเก่า→ใหม่, ยังมีข้อความเก่ากว่านี้อีกหรือไม่)
+    """
+    response = supabase.table("chat_messages") \
+        .select("role, content") \
+        .eq("session_id", session_id) \
+        .order("created_at", desc=True) \
+        .order("id", desc=True) \
+        .range(offset, offset + limit) \
+        .execute()
+    
+    rows = response.data[:limit]
+    messages = [{"role": msg["role"], "content": msg["content"]} for msg in reversed(rows)]
+    return messages, len(response.data) > limit
+
+def ensure_session_messages(session_id):
+    """
+    โหลดข้อความของแชทจาก database ครั้งแรกที่เปิด (เฉพาะ MESSAGE_WINDOW ข้อความล่าสุด)
+    แล้วเก็บไว้ใน session state
+    """
+    session_data = st.session_state.chat_sessions.get(session_id)
+    if session_data is None or session_data.get("_messages_loaded", True):
+        return session_data
+    
+    try:
+        messages, has_older = cached_for_user(
+            st.session_state.user.id, f"recent:{session_id}:{MESSAGE_WINDOW}",
+            lambda: load_recent_messages(session_id, MESSAGE_WINDOW)
+        )
+    except Exception as e:
+        st.error(f"Error loading from database: {str(e)}")
+        return session_data
+    
+    session_data["messages"] = messages
+    session_data["_messages_loaded"] = True
+    session_data["_has_older"] = has_older
+    return mark_session_saved(session_data)
+
+def load_older_messages(session_id, count=MESSAGE_WINDOW):
+    """
+    โหลดข้อความที่เก่ากว่าที่มีอยู่อีก count ข้อความ แล้วต่อไว้ด้านหน้า
+    (ข้อความที่บันทึกแล้วทั้งหมด = _saved_count จึงใช้เป็น offset จากข้อความใหม่สุดได้)
+    """
+    session_data = st.session_state.chat_sessions.get(session_id)
+    if not session_data or not session_data.get("_has_older"):
+        return 0
+    
+    flush_pending_writes()
+    try:
+        older, has_older = load_recent_messages(session_id, count, offset=session_data.get("_saved_count", 0))
+    except Exception as e:
+        st.error(f"Error loading from database: {str(e)}")
+        return 0
+    
+    session_data["messages"][:0] = older
+    session_data["_saved_count"] = session_data.get("_saved_count", 0) + len(older)
+    session_data["_has_older"] = has_older
+    return len(older)
+
+def ensure_message_window(session_id, window):
+    """ให้มีข้อความใน memory อย่างน้อย window ข้อความ (ถ้าใน database มีพอ)"""
+    session_data = st.session_state.chat_sessions.get(session_id)
+    if session_data and session_data.get("_has_older") and len(session_data["messages"]) < window:
+        load_older_messages(session_id, window - len(session_data["messages"]))
+    return session_data
+
+@timed("db.delete_session")
 def delete_session_from_db(session_id):
-    """ลบแชทจาก Supabase"""
+    """ลบแชทจาก Supabase (ผ่าน write-behind queue เพื่อให้ลำดับต่อจากการบันทึกที่ค้างอยู่)"""
     try:
-        supabase.table("chat_sessions").delete().eq("id", session_id).execute()
+        submit_session_change({
+            "session_id": session_id,
+            "user_id": st.session_state.user.id,
+            "meta": None,
+            "rewrite": False,
+            "messages": [],
+            "delete": True
+        })
         return True
     except Exception as e:
+        mark_error()
         st.error(f"Error deleting from database: {str(e)}")
         return False
 
+# ============================================================
+# Shared Cache (shared_cache.py)
+# ============================================================
+# ใช้ร่วมกันระหว่าง replica: หัวแชท/ข้อความล่าสุดของผู้ใช้ และคำตอบของ Assistant
+@st.cache_resource
+def load_shared_cache():
+    """backend ตาม SHARED_CACHE (None = ปิด ใช้แคชใน process อย่างเดียว)"""
+    return create_cache_backend()
+
+shared_cache = load_shared_cache()
+
+def sessions_namespace(user_id):
+    return f"sessions:{user_id}"
+
+def cached_for_user(user_id, name, fetch):
+    """
+    อ่านข้อมูลแชทของผู้ใช้ผ่าน shared cache (เรียก fetch() เมื่อไม่มีในแคช)
+    key มี version ของผู้ใช้ เมื่อมีการเขียน invalidate_user_sessions จะทำให้ key เก่าใช้ไม่ได้ทุก replica
+    """
+    if shared_cache is None:
+        return fetch()
+    key = shared_cache.versioned_key(sessions_namespace(user_id), name)
+    value = shared_cache.get(key)
+    if value is None:
+        value = fetch()
+        shared_cache.set(key, value)
+    return value
+
+def invalidate_user_sessions(user_ids):
+    if shared_cache is None:
+        return
+    for user_id in set(user_ids):
+        shared_cache.bump_version(sessions_namespace(user_id))
+
+# ============================================================
+# Write-Behind Queue
+# ============================================================
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "1") == "1"
+WRITE_READ_TIMEOUT = float(os.getenv("WRITE_READ_TIMEOUT", "5"))
+
+@st.cache_resource
+def load_write_queue():
+    """queue เดียวต่อ process ใช้ร่วมกันทุกผู้ใช้ (journal อยู่ที่ WRITE_JOURNAL)"""
+    if not WRITE_BEHIND:
+        return None
+    return WriteBehindQueue(write_session_changes)
+
+write_queue = load_write_queue()
+
+# ============================================================
+# Chat History Search
+# ============================================================
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))
+
+@timed("db.search_messages")
+def search_chat_history(query, page=0):
+    """
+    ค้นหาข้อความในประวัติแชททั้งหมดผ่าน full-text index ฝั่ง database (RPC search_chat_sessions)
+    ไม่ขึ้นกับว่าโหลดข้อความเข้ามาใน session state แล้วกี่แชท
+    คืนค่า (ผลลัพธ์ของหน้านี้, จำนวนแชทที่ตรงทั้งหมด)
+    """
+    cache = st.session_state.get("search_cache")
+    if cache is None or cache["query"] != query:
+        cache = st.session_state.search_cache = {"query": query, "pages": {}}
+    if page in cache["pages"]:
+        return cache["pages"][page]
+    
+    try:
+        response = supabase.rpc("search_chat_sessions", {
+            "p_user_id": st.session_state.user.id,
+            "p_query": query,
+            "p_limit": SEARCH_PAGE_SIZE,
+            "p_offset": page * SEARCH_PAGE_SIZE
+        }).execute()
+    except Exception as e:
+        mark_error()
+        st.error(f"Error searching database: {str(e)}")
+        return [], 0
+    
+    rows = response.data or []
+    result = (rows, rows[0]["total"] if rows else 0)
+    cache["pages"][page] = result
+    return result
+
+def clear_search_cache():
+    """ผลค้นหาเก่าใช้ไม่ได้แล้วเมื่อมีข้อความใหม่/ลบแชท"""
+    st.session_state.pop("search_cache", None)
+
+def snippet_to_markdown(snippet):
+    """แปลง snippet HTML จาก pgroonga_snippet_html เป็น markdown (ตัวหนาที่คำค้น)"""
+    if not snippet:
+        return ""
+    text = re.sub(r'<span class="keyword">(.*?)</span>', "\x00\\1\x00", snippet)
+    text = html.unescape(re.sub(r"<[^>]+>", "", text))
+    text = re.sub(r"([\\`*_\[\]#<>|])", r"\\\1", " ".join(text.split()))
+    return text.replace("\x00", "**")
+
 # ============================================================
 # AI Assistant
 # ============================================================
@@ -157,41 +516,195 @@ def load_assistant():
 
 assistant = load_assistant()
 
+@st.cache_resource
+def load_answer_cache():
+    """แคชคำตอบใช้ร่วมกันทุกผู้ใช้ใน process เดียวกัน (และทุก replica ถ้าเปิด SHARED_CACHE)"""
+    return AnswerCache(backend=shared_cache)
+
+answer_cache = load_answer_cache()
+
+@st.cache_resource
+def load_single_flight():
+    """คำถามเดียวกันที่ผู้ใช้หลายคนถามพร้อมกัน ใช้การเรียก Assistant ร่วมกัน (ทั้ง process)"""
+    return SingleFlight()
+
+inflight_requests = load_single_flight()
+SHOW_CACHE_STATS = os.getenv("SHOW_CACHE_STATS") == "1"
+
+@timed("assistant.corpus_version")
+def corpus_version():
+    """เวอร์ชันของเอกสารใน Assistant ใช้เป็นส่วนหนึ่งของ key แคช"""
+    return get_corpus_version(assistant)
+
+def ensure_assistant_thread(session_data):
+    """
+    สร้าง thread ให้แชทตอนส่งข้อความแรก (ไม่ใช่ตอนกด New Chat)
+    Assistant บางเวอร์ชันไม่มี create_thread จะได้ thread_id จาก chunk ของคำตอบแทน
+    """
+    if not hasattr(assistant, "create_thread"):
+        return None
+    try:
+        session_data["thread_id"] = timed("assistant.create_thread")(assistant.create_thread)().id
+    except Exception:
+        return None
+    return session_data["thread_id"]
+
+def stream_assistant_reply(prompt, session_data, context=None):
+    """
+    ส่งคำถามไปยัง Pinecone แบบ streaming แล้ว yield คำตอบทีละส่วน
+    context: ข้อความจาก build_chat_context (ถ้าไม่มี จะใช้ thread ของ Assistant แทน)
+    """
+    if context:
+        messages = [Message(role=m["role"], content=m["content"]) for m in context]
+        chunks = assistant.chat(messages=messages, stream=True)
+    else:
+        msg = Message(content=prompt)
+        thread_id = session_data.get("thread_id") or ensure_assistant_thread(session_data)
+        
+        # ใช้ thread_id แยกตามแชท ถ้ามี
+        if thread_id:
+            chunks = assistant.chat(messages=[msg], thread_id=thread_id, stream=True)
+        else:
+            chunks = assistant.chat(messages=[msg], stream=True)
+    
+    for chunk in chunks:
+        if chunk is None:
+            continue
+        # เก็บ thread_id ไว้ใช้ครั้งต่อไป
+        if not session_data.get("thread_id") and getattr(chunk, "thread_id", None):
+            session_data["thread_id"] = chunk.thread_id
+        if getattr(chunk, "type", None) == "content_chunk" and chunk.delta.content:
+            yield chunk.delta.content
+
 # ============================================================
-# Session Management Logic
+# Conversation Context (conversation_context.py)
 # ============================================================
-def create_new_chat():
-    new_id = hashlib.md5(str(time.time()).encode()).hexdigest()
-    
-    # สร้าง thread ใหม่สำหรับแชทนี้
+
+# คำตอบที่ไม่ได้มาจาก Assistant (error / ข้อความสำรองจากเอกสาร) ที่บันทึกไว้ก่อนมี _failed
+FAILED_REPLY_PREFIXES = ("Error: ",) + tuple(f"⚠️ {text} " for text in TRANSLATIONS["local_fallback"].values())
+
+def is_failed_reply(message):
+    """คำตอบที่ล้มเหลว (chat_page ติด _failed ไว้, ข้อความที่โหลดจาก database ดูจากขึ้นต้นข้อความ)"""
+    return message["role"] == "assistant" and (
+        message.get("_failed") or message["content"].replace("\n", " ").startswith(FAILED_REPLY_PREFIXES)
+    )
+
+def conversation_history(messages):
+    """ประวัติที่ใช้เป็น context (ไม่รวมคำสั่ง /docs และผลค้นหาของมัน และ turn ที่ตอบไม่สำเร็จ)"""
+    history, skip = [], False
+    for i, message in enumerate(messages):
+        if message["role"] == "user":
+            reply = messages[i + 1] if i + 1 < len(messages) else None
+            skip = message["content"].startswith(LOCAL_SEARCH_COMMAND + " ") \
+                or (reply is not None and is_failed_reply(reply))
+        if not skip:
+            history.append(message)
+    return history
+
+def build_chat_context(session_data):
+    """
+    สร้างข้อความที่จะส่งให้ Assistant จากประวัติในเครื่อง ภายใต้ CONTEXT_TOKEN_BUDGET
+    (ข้อความสุดท้ายของแชทต้องเป็นคำถามปัจจุบัน) คืน None ถ้าปิดไว้
+    จำนวน token ที่ส่งในแต่ละรอบถูกบันทึกเป็น telemetry "assistant.context"
+    """
+    if CONTEXT_TOKEN_BUDGET <= 0:
+        return None
+    start = time.perf_counter()
+    context, report = build_context(conversation_history(session_data["messages"]),
+                                    session_data.setdefault("_context_state", {}))
+    session_data["_context_report"] = report
+    record("assistant.context", (time.perf_counter() - start) * 1000, **report)
+    return context
+
+# ============================================================
+# Local Document Search (local_index.py)
+# ============================================================
+# พิมพ์ "/docs <คำค้น>" เพื่อถามว่าเอกสารไหนเกี่ยวข้อง โดยไม่ต้องเรียก Assistant
+LOCAL_SEARCH_COMMAND = "/docs"
+
+@timed("local_index.search")
+def search_local_documents(query):
+    """ค้นหาจากดัชนี BM25 บนเครื่อง คืน None ถ้ายังไม่มีดัชนี (หรือโหลดไม่ได้)"""
     try:
-        thread = assistant.create_thread()
-        thread_id = thread.id
-    except:
-        thread_id = None
+        index = get_index()
+    except Exception:
+        mark_error()
+        return None
+    if index is None:
+        return None
+    return index.search_documents(query)
+
+# ============================================================
+# Session Management Logic
+# ============================================================
+SIDEBAR_PAGE_SIZE = int(os.getenv("SIDEBAR_PAGE_SIZE", "20"))
+
+def get_session_order():
+    """
+    ลำดับ session id (ใหม่สุดก่อน) เก็บไว้ใน session state
+    sort ทั้งหมดเฉพาะตอนโหลดใหม่ ส่วนการสร้าง/ลบแชทจะอัปเดตแบบ incremental
+    """
+    sessions = st.session_state.chat_sessions
+    order = st.session_state.get("session_order")
+    if order is None or st.session_state.get("session_order_source") is not sessions \
+            or len(order) != len(sessions):
+        order = sorted(sessions, key=lambda sid: sessions[sid]["created_at"], reverse=True)
+        st.session_state.session_order = order
+        st.session_state.session_order_source = sessions
+    return order
+
+def insert_session_order(session_id):
+    """ใส่ session ใหม่ในตำแหน่งที่ถูกต้องโดยไม่ต้อง sort ใหม่ทั้งหมด"""
+    sessions = st.session_state.chat_sessions
+    order = st.session_state.get("session_order")
+    if order is None or st.session_state.get("session_order_source") is not sessions \
+            or len(order) + 1 != len(sessions):
+        return get_session_order()
     
+    created_at = sessions[session_id]["created_at"]
+    index = next(
+        (i for i, sid in enumerate(order) if sessions[sid]["created_at"] < created_at),
+        len(order)
+    )
+    order.insert(index, session_id)
+    return order
+
+def remove_session_order(session_id):
+    order = st.session_state.get("session_order")
+    if order is not None and session_id in order:
+        order.remove(session_id)
+
+def new_chat_session():
+    """
+    สร้างแชทใหม่ใน session state เท่านั้น (ไม่เรียก Pinecone / Supabase)
+    thread ของ Assistant สร้างตอนส่งข้อความแรก และแชทถูกบันทึกลง database หลังตอบครั้งแรก
+    """
+    new_id = hashlib.md5(str(time.time()).encode()).hexdigest()
     new_session = {
         "messages": [],
         "created_at": datetime.now().isoformat(),
         "title": t("new_chat"),
-        "thread_id": thread_id
+        "thread_id": None
     }
-    
     st.session_state.chat_sessions[new_id] = new_session
     st.session_state.current_session_id = new_id
-    
-    # บันทึกลง database
-    save_session_to_db(new_id, new_session)
-    
+    return new_id
+
+def create_new_chat():
+    insert_session_order(new_chat_session())
     st.rerun()
 
 def delete_chat(session_id):
     if session_id in st.session_state.chat_sessions:
-        # ลบจาก database
-        delete_session_from_db(session_id)
+        # ลบจาก database (แชทที่ยังไม่เคยบันทึกไม่ต้องเรียก database)
+        if "_saved_meta" in st.session_state.chat_sessions[session_id]:
+            delete_session_from_db(session_id)
         
         # ลบจาก session state
         del st.session_state.chat_sessions[session_id]
+        remove_session_order(session_id)
+        if st.session_state.get("renaming_session_id") == session_id:
+            st.session_state.renaming_session_id = None
         
         # If deleted current, switch to another or create new
         if st.session_state.current_session_id == session_id:
@@ -200,3 +713,151 @@ def delete_chat(session_id):
             else:
                 create_new_chat() # Will rerun
         st.rerun()
+
+# ============================================================
+# Delta Session Sync
+# ============================================================
+# เห็นแชทที่สร้าง/แก้/ลบจากแท็บหรืออุปกรณ์อื่นโดยไม่ต้องโหลดประวัติทั้งหมดใหม่
+# (ต้องใช้ migration 20261018000200_session_delta_sync.sql)
+SESSION_SYNC_SECONDS = float(os.getenv("SESSION_SYNC_SECONDS", "15"))
+SYNC_OVERLAP_SECONDS = 5    # เผื่อ transaction ที่ commit ช้ากว่าเวลาใน updated_at
+SYNC_EPOCH = "1970-01-01T00:00:00+00:00"
+
+_FRACTION = re.compile(r"\.(\d+)")
+
+def parse_timestamp(value):
+    """
+    แปลงเวลาจาก PostgREST เป็น datetime
+    PostgREST ตัดเลข 0 ท้ายเศษวินาทีทิ้ง (เช่น .5 หรือ .12345) ซึ่ง datetime.fromisoformat ของ Python 3.10 ไม่รับ
+    """
+    value = _FRACTION.sub(lambda m: "." + m.group(1)[:6].ljust(6, "0"), value.replace("Z", "+00:00"), count=1)
+    return datetime.fromisoformat(value)
+
+def set_sync_watermark(rows):
+    """จำเวลา updated_at ล่าสุดที่เห็น (เวลาของ database ไม่ใช่ของเครื่องนี้)"""
+    stamps = [parse_timestamp(row["updated_at"]) for row in rows]
+    st.session_state.sync_watermark = max(stamps).isoformat() if stamps else SYNC_EPOCH
+    st.session_state.synced_at = time.monotonic()
+
+@timed("db.sync_sessions")
+def fetch_session_changes(user_id, since):
+    """หัวแชทที่เปลี่ยนหลัง since และแชทที่ถูกลบหลัง since"""
+    changed = supabase.table("chat_sessions") \
+        .select(SESSION_HEADER_COLUMNS) \
+        .eq("user_id", user_id) \
+        .gt("updated_at", since) \
+        .order("updated_at") \
+        .execute()
+    deleted = supabase.table("chat_session_deletions") \
+        .select("session_id, deleted_at") \
+        .eq("user_id", user_id) \
+        .gt("deleted_at", since) \
+        .execute()
+    return changed.data, deleted.data
+
+def fetch_new_messages(session_id, known_count):
+    """ข้อความที่ต่อจาก known_count ข้อความแรกของแชท (ข้อความถูก append อย่างเดียว จึงใช้ตำแหน่งได้)"""
+    messages = []
+    while True:
+        response = supabase.table("chat_messages") \
+            .select("role, content") \
+            .eq("session_id", session_id) \
+            .order("created_at") \
+            .order("id") \
+            .range(known_count + len(messages), known_count + len(messages) + MESSAGES_PAGE_SIZE - 1) \
+            .execute()
+        messages.extend({"role": msg["role"], "content": msg["content"]} for msg in response.data)
+        if len(response.data) < MESSAGES_PAGE_SIZE:
+            return messages
+
+def merge_session_row(row):
+    """รวมหัวแชทที่เปลี่ยนเข้ากับ session state (แก้ dict เดิม) คืน True ถ้ามีอะไรเปลี่ยน"""
+    sessions = st.session_state.chat_sessions
+    meta = {"title": row["title"], "thread_id": row["thread_id"], "created_at": row["created_at"]}
+    session_data = sessions.get(row["id"])
+    
+    # แชทใหม่จากที่อื่น: เพิ่มเฉพาะหัวแชท ข้อความโหลดเมื่อเปิด
+    if session_data is None:
+        sessions[row["id"]] = mark_session_saved({
+            **meta, "messages": [], "_messages_loaded": False, "_message_count": row["message_count"]
+        })
+        insert_session_order(row["id"])
+        return True
+    
+    changed = False
+    # หัวแชทที่แก้ในเครื่องนี้แต่ยังไม่ได้บันทึก ให้ของเครื่องนี้ชนะ
+    if session_data.get("_saved_meta") == _session_meta(session_data) and _session_meta(session_data) != meta:
+        session_data.update(meta)
+        session_data["_saved_meta"] = _session_meta(session_data)
+        changed = True
+    
+    known_count = session_data.get("_message_count", 0)
+    if row["message_count"] == known_count:
+        return changed
+    messages = session_data["messages"]
+    if not session_data.get("_messages_loaded", True):
+        pass  # ยังไม่เคยเปิด: ensure_session_messages จะโหลดข้อความล่าสุดเอง
+    elif session_data.get("_saved_count", 0) != len(messages):
+        return changed  # มีข้อความที่ยังไม่ได้บันทึก รอ sync รอบหน้า
+    elif row["message_count"] > known_count:
+        new_messages = fetch_new_messages(row["id"], known_count)
+        messages.extend(new_messages)
+        session_data["_saved_count"] += len(new_messages)
+        row["message_count"] = known_count + len(new_messages)
+    else:
+        # ประวัติถูกเขียนใหม่ที่อื่น (สั้นลง) โหลดหน้าต่างข้อความล่าสุดใหม่เมื่อเปิด
+        session_data.update(messages=[], _messages_loaded=False, _has_older=False, _saved_count=0)
+        session_data.pop("_context_state", None)
+    session_data["_message_count"] = row["message_count"]
+    return True
+
+def drop_deleted_session(session_id):
+    """แชทที่ถูกลบจากที่อื่น"""
+    if session_id not in st.session_state.chat_sessions:
+        return False
+    del st.session_state.chat_sessions[session_id]
+    remove_session_order(session_id)
+    if st.session_state.get("renaming_session_id") == session_id:
+        st.session_state.renaming_session_id = None
+    if st.session_state.get("current_session_id") == session_id:
+        if st.session_state.chat_sessions:
+            st.session_state.current_session_id = get_session_order()[0]
+        else:
+            insert_session_order(new_chat_session())
+    return True
+
+def sync_sessions_from_db(force=False):
+    """
+    ดึงเฉพาะแชทที่เปลี่ยนหลัง sync ครั้งก่อน (updated_at > watermark) แล้วรวมเข้า
+    st.session_state.chat_sessions แบบ in place ทำไม่บ่อยกว่า SESSION_SYNC_SECONDS
+    คืนจำนวนแชทที่เปลี่ยน
+    """
+    watermark = st.session_state.get("sync_watermark")
+    if watermark is None:
+        return 0
+    now = time.monotonic()
+    if not force and now - st.session_state.get("synced_at", 0) < SESSION_SYNC_SECONDS:
+        return 0
+    
+    # การเขียนของเครื่องนี้ต้องถึง database ก่อน ไม่อย่างนั้น message_count จะดูเหมือนข้อความหายไป
+    # ถ้ายังค้างอยู่ให้ข้ามรอบนี้ไปเลย (ไม่รอ flush เพราะถูกเรียกทุกครั้งที่ render) แล้วลองใหม่ใน rerun ถัดไป
+    if write_queue is not None and write_queue.pending_count(st.session_state.user.id):
+        return 0
+    st.session_state.synced_at = now
+    
+    since = (parse_timestamp(watermark) - timedelta(seconds=SYNC_OVERLAP_SECONDS)).isoformat()
+    try:
+        rows, deleted = fetch_session_changes(st.session_state.user.id, since)
+        changed = sum(merge_session_row(row) for row in rows)
+        changed += sum(drop_deleted_session(row["session_id"]) for row in deleted)
+    except Exception as e:
+        st.error(f"Error syncing from database: {str(e)}")
+        return 0
+    
+    stamps = [parse_timestamp(watermark)]
+    stamps += [parse_timestamp(row["updated_at"]) for row in rows]
+    stamps += [parse_timestamp(row["deleted_at"]) for row in deleted]
+    st.session_state.sync_watermark = max(stamps).isoformat()
+    if changed:
+        clear_search_cache()
+    return changed
@@ -0,0 +1,203 @@
+"""
+AI Chatbot for UNAI - Shared Cache
+แคชที่ใช้ร่วมกันระหว่างหลาย process / replica ของ Streamlit
+(st.cache_resource และ st.session_state แยกกันต่อ process จึงโหลดข้อมูลเดิมซ้ำทุก replica)
+- MemoryCache: ภายใน process เดียว (ใช้ทดสอบ หรือรัน replica เดียว)
+- SQLiteCache: ไฟล์ SQLite ที่ทุก process บนเครื่อง/volume เดียวกันเปิดร่วมกัน
+backend อื่น (เช่น Redis) ทำได้โดย implement CacheBackend
+
+key มี version ต่อ namespace: เมื่อข้อมูลเปลี่ยนให้เรียก bump_version(namespace)
+key เดิมทั้งหมดของ namespace นั้นจะใช้ไม่ได้ทันทีในทุก replica (ไม่ต้องลบทีละ key)
+
+ตั้งค่าผ่าน .env:
+    SHARED_CACHE=off | memory | sqlite:<path>   (default: off)
+    SHARED_CACHE_TTL=<วินาที>                    อายุของแต่ละ key (default: 300)
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+SHARED_CACHE_TTL = float(os.getenv('SHARED_CACHE_TTL', '300'))
+SHARED_CACHE_SIZE = int(os.getenv('SHARED_CACHE_SIZE', '10000'))    # เฉพาะ MemoryCache
+SQLITE_PRUNE_EVERY = 500    # ลบ key ที่หมดอายุทุกๆ n ครั้งที่ set
+
+logger = logging.getLogger("unai.shared_cache")
+
+# ============================================================
+# Interface
+# ============================================================
+
+class CacheBackend:
+    """
+    interface ของ shared cache (ค่าที่เก็บต้องแปลงเป็น JSON ได้)
+    ถ้า backend มีปัญหา ให้ถือเป็น cache miss แทนการ raise เพื่อไม่ให้แอปใช้งานไม่ได้
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float = SHARED_CACHE_TTL):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def get_version(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    def bump_version(self, namespace: str) -> int:
+        """เพิ่ม version ของ namespace แบบ atomic (version ไม่มีวันหมดอายุ)"""
+        raise NotImplementedError
+
+    def versioned_key(self, namespace: str, key: str) -> str:
+        return f"{namespace}:v{self.get_version(namespace)}:{key}"
+
+# ============================================================
+# Memory Backend
+# ============================================================
+
+class MemoryCache(CacheBackend):
+    """LRU ใน memory (thread-safe) เก็บค่าเป็น JSON เหมือน backend จริง"""
+
+    def __init__(self, max_size: int = SHARED_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()    # key -> (JSON, หมดอายุเมื่อ)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return json.loads(entry[0])
+
+    def set(self, key, value, ttl=SHARED_CACHE_TTL):
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._entries[key] = (data, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_version(self, namespace):
+        with self._lock:
+            return self._versions.get(namespace, 0)
+
+    def bump_version(self, namespace):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            return self._versions[namespace]
+
+# ============================================================
+# SQLite Backend
+# ============================================================
+
+class SQLiteCache(CacheBackend):
+    """
+    เก็บในไฟล์ SQLite (WAL) หลาย process เปิดไฟล์เดียวกันได้
+    ใช้ connection แยกต่อ thread และเวลาแบบ wall clock เพื่อให้ทุก process เห็นเวลาหมดอายุตรงกัน
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._sets = 0
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_entries "
+                     "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_versions "
+                     "(namespace TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._connect().execute(
+                "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl=SHARED_CACHE_TTL):
+        data = json.dumps(value, ensure_ascii=False)
+        try:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?)",
+                         (key, data, time.time() + ttl))
+            self._sets += 1
+            if self._sets % SQLITE_PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+    def delete(self, key):
+        try:
+            self._connect().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+    def get_version(self, namespace):
+        try:
+            row = self._connect().execute(
+                "SELECT version FROM cache_versions WHERE namespace = ?", (namespace,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return 0
+        return row[0] if row else 0
+
+    def bump_version(self, namespace):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT INTO cache_versions VALUES (?, 1) "
+                         "ON CONFLICT(namespace) DO UPDATE SET version = version + 1", (namespace,))
+            version = conn.execute("SELECT version FROM cache_versions WHERE namespace = ?",
+                                   (namespace,)).fetchone()[0]
+            conn.execute("COMMIT")
+            return version
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.warning(f"Shared cache version bump failed: {e}")
+            return 0
+
+# ============================================================
+# Functions
+# ============================================================
+
+def create_cache_backend(spec: str = None) -> Optional[CacheBackend]:
+    """สร้าง backend จากค่า SHARED_CACHE (อ่านตอนเรียก หลัง load_dotenv) คืน None ถ้าปิดไว้"""
+    spec = (spec or os.getenv('SHARED_CACHE') or "off").strip()
+    if spec == "off":
+        return None
+    if spec == "memory":
+        return MemoryCache()
+    if spec.startswith("sqlite:"):
+        return SQLiteCache(spec[len("sqlite:"):] or "shared_cache.sqlite3")
+    raise ValueError(f"Unknown SHARED_CACHE backend: {spec}")
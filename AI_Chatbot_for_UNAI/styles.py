@@ -1,52 +1,80 @@
+import functools
+import os
+import re
 import streamlit as st
+from fetch_fonts import FONTS_URL
 
-def inject_css():
-    # Define colors
-    if st.session_state.theme == "light":
-        colors = {
-            "bg": "#FFFFFF",
-            "text": "#000000",
-            "sidebar_bg": "#F8FAFC",
-            "sidebar_hover": "#E2E8F0",
-            "chat_user_bg": "#000000",
-            "chat_user_text": "#FFFFFF",
-            "chat_ai_bg": "#F1F5F9",
-            "chat_ai_text": "#000000",
-            "input_bg": "#FFFFFF",
-            "input_text": "#000000",
-            "border": "#E2E8F0",
-            "btn_bg": "#FFFFFF",
-            "btn_text": "#000000",
-            "btn_hover": "#F1F5F9",
-            "search_placeholder": "#666666",
-            "popover_bg": "#FFFFFF",
-            "popover_text": "#000000"
-        }
-    else:  # Dark theme
-        colors = {
-            "bg": "#000000",
-            "text": "#FFFFFF",
-            "sidebar_bg": "#121212",
-            "sidebar_hover": "#333333",
-            "chat_user_bg": "#FFFFFF",
-            "chat_user_text": "#000000",
-            "chat_ai_bg": "#1E1E1E",
-            "chat_ai_text": "#FFFFFF",
-            "input_bg": "#FFFFFF",
-            "input_text": "#000000",
-            "border": "#444444",
-            "btn_bg": "#121212",
-            "btn_text": "#FFFFFF",
-            "btn_hover": "#333333",
-            "search_placeholder": "#CCCCCC",
-            "popover_bg": "#1E1E1E",
-            "popover_text": "#FFFFFF"
-        }
+# ฟอนต์ Inter/Sarabun แบบ local (สร้างด้วย python fetch_fonts.py)
+# เสิร์ฟผ่าน static serving ของ Streamlit ที่ /app/static/fonts/
+# ถ้ายังไม่ได้ดาวน์โหลด จะโหลดจาก Google Fonts แบบเดิม
+FONTS_CSS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "fonts", "fonts.css")
+
+# ============================================================
+# Theme Colors
+# ============================================================
+THEMES = {
+    "light": {
+        "bg": "#FFFFFF",
+        "text": "#000000",
+        "sidebar_bg": "#F8FAFC",
+        "sidebar_hover": "#E2E8F0",
+        "chat_user_bg": "#000000",
+        "chat_user_text": "#FFFFFF",
+        "chat_ai_bg": "#F1F5F9",
+        "chat_ai_text": "#000000",
+        "input_bg": "#FFFFFF",
+        "input_text": "#000000",
+        "border": "#E2E8F0",
+        "btn_bg": "#FFFFFF",
+        "btn_text": "#000000",
+        "btn_hover": "#F1F5F9",
+        "search_placeholder": "#666666",
+        "popover_bg": "#FFFFFF",
+        "popover_text": "#000000"
+    },
+    "dark": {
+        "bg": "#000000",
+        "text": "#FFFFFF",
+        "sidebar_bg": "#121212",
+        "sidebar_hover": "#333333",
+        "chat_user_bg": "#FFFFFF",
+        "chat_user_text": "#000000",
+        "chat_ai_bg": "#1E1E1E",
+        "chat_ai_text": "#FFFFFF",
+        "input_bg": "#FFFFFF",
+        "input_text": "#000000",
+        "border": "#444444",
+        "btn_bg": "#121212",
+        "btn_text": "#FFFFFF",
+        "btn_hover": "#333333",
+        "search_placeholder": "#CCCCCC",
+        "popover_bg": "#1E1E1E",
+        "popover_text": "#FFFFFF"
+    }
+}
+
+# ============================================================
+# Stylesheet
+# ============================================================
+
+def load_font_faces():
+    """อ่าน @font-face ของฟอนต์ที่ bundle ไว้ (ถ้ายังไม่ได้ดาวน์โหลดจะ @import จาก Google Fonts แทน)"""
+    try:
+        with open(FONTS_CSS, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return f"@import url('{FONTS_URL}');"
 
-    st.markdown(f"""
-    <style>
+def minify_css(css):
+    """ตัด comment และช่องว่างที่ไม่จำเป็น เพื่อลดขนาดที่ส่งไปยัง browser ทุก rerun"""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};,>])\s*", r"\1", css).strip()
+
+def build_stylesheet(colors, font_faces=""):
+    css = f"""
         /* Global Reset & Fonts */
-        @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&family=Sarabun:wght@400;500;600&display=swap');
+        {font_faces}
         
         html, body, [class*="css"] {{
             font-family: 'Inter', 'Sarabun', sans-serif;
@@ -327,6 +355,13 @@ def inject_css():
         [data-testid="stChatMessage"][data-testid*="assistant"] * {{
             color: {colors['chat_ai_text']} !important;
         }}
+    """
+    return f"<style>{minify_css(css)}</style>"
+
+@functools.lru_cache(maxsize=None)
+def get_stylesheet(theme):
+    """สร้าง stylesheet ของแต่ละธีมครั้งเดียวต่อ process"""
+    return build_stylesheet(THEMES.get(theme, THEMES["light"]), load_font_faces())
 
-    </style>
-    """, unsafe_allow_html=True)
+def inject_css():
+    st.markdown(get_stylesheet(st.session_state.theme), unsafe_allow_html=True)
@@ -0,0 +1,71 @@
+-- ============================================================
+-- Full-text search ในประวัติแชท (chat_messages.content)
+-- ใช้ PGroonga เพราะ tokenizer แบบ bigram ตัดคำภาษาไทยได้ (ไม่มีเว้นวรรคระหว่างคำ)
+-- ใช้กับ logic.search_chat_history()
+-- ============================================================
+
+create extension if not exists pgroonga with schema extensions;
+
+create index if not exists chat_messages_content_search_idx
+    on public.chat_messages
+    using pgroonga (content)
+    with (tokenizer = 'TokenBigram', normalizer = 'NormalizerAuto');
+
+create index if not exists chat_sessions_user_id_idx
+    on public.chat_sessions (user_id);
+
+-- คืนค่าแชทที่มีข้อความตรงกับคำค้น (หนึ่งแถวต่อแชท) พร้อม snippet และจำนวนผลทั้งหมด
+-- security invoker: RLS ของ chat_sessions / chat_messages ยังมีผลเหมือน query ปกติ
+create or replace function public.search_chat_sessions(
+    p_user_id public.chat_sessions.user_id%type,
+    p_query text,
+    p_limit integer default 10,
+    p_offset integer default 0
+)
+returns table (
+    session_id public.chat_sessions.id%type,
+    title text,
+    created_at timestamptz,
+    snippet text,
+    match_count bigint,
+    score double precision,
+    total bigint
+)
+language sql
+stable
+security invoker
+set search_path = public, extensions
+as $$
+    with hits as (
+        select m.session_id,
+               m.content,
+               m.created_at,
+               pgroonga_score(m.tableoid, m.ctid) as score
+        from public.chat_messages m
+        join public.chat_sessions s on s.id = m.session_id
+        where s.user_id = p_user_id
+          -- &@ ค้นคำค้นตามตัวอักษร (ไม่ใช่ &@~ ที่แปลง OR / - / ( / " เป็นไวยากรณ์ query ของ Groonga
+          -- ทำให้ข้อความที่ผู้ใช้พิมพ์เช่นวงเล็บไม่ครบ error ทุกครั้ง)
+          and m.content &@ p_query
+    ),
+    per_session as (
+        select h.session_id,
+               count(*) as match_count,
+               max(h.score) as score,
+               (array_agg(h.content order by h.score desc, h.created_at desc))[1] as best_content
+        from hits h
+        group by h.session_id
+    )
+    select p.session_id,
+           s.title,
+           s.created_at,
+           (pgroonga_snippet_html(p.best_content, array[p_query], 160))[1],
+           p.match_count,
+           p.score,
+           count(*) over () as total
+    from per_session p
+    join public.chat_sessions s on s.id = p.session_id
+    order by p.score desc, s.created_at desc
+    limit p_limit
+    offset p_offset;
+$$;
@@ -0,0 +1,118 @@
+-- ============================================================
+-- Delta sync ของแชท (ใช้กับ logic.sync_sessions_from_db())
+-- - chat_sessions.updated_at: เปลี่ยนทุกครั้งที่หัวแชทถูกแก้ หรือมีข้อความถูกเพิ่ม/ลบ
+-- - chat_sessions.message_count: จำนวนข้อความใน database (ใช้ดึงเฉพาะข้อความใหม่)
+-- - chat_session_deletions: tombstone ของแชทที่ถูกลบ (แถวที่ลบแล้ว query ด้วย updated_at ไม่เจอ)
+-- ============================================================
+
+alter table public.chat_sessions
+    add column if not exists updated_at timestamptz not null default now(),
+    add column if not exists message_count integer not null default 0;
+
+update public.chat_sessions s
+set message_count = (select count(*) from public.chat_messages m where m.session_id = s.id);
+
+create index if not exists chat_sessions_user_updated_at_idx
+    on public.chat_sessions (user_id, updated_at);
+
+-- ---------- updated_at ของหัวแชท ----------
+
+create or replace function public.chat_sessions_touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists chat_sessions_touch_updated_at on public.chat_sessions;
+create trigger chat_sessions_touch_updated_at
+    before update on public.chat_sessions
+    for each row execute function public.chat_sessions_touch_updated_at();
+
+-- ---------- ข้อความเพิ่ม/ลบ -> อัปเดต message_count (และ updated_at ผ่าน trigger ด้านบน) ----------
+-- เป็น statement-level trigger: insert ข้อความหลายแถวในครั้งเดียวอัปเดตแต่ละแชทครั้งเดียว
+
+create or replace function public.chat_messages_count_inserted()
+returns trigger
+language plpgsql
+set search_path = public
+as $$
+begin
+    update public.chat_sessions s
+    set message_count = s.message_count + c.n
+    from (select session_id, count(*) as n from inserted group by session_id) c
+    where s.id = c.session_id;
+    return null;
+end;
+$$;
+
+create or replace function public.chat_messages_count_deleted()
+returns trigger
+language plpgsql
+set search_path = public
+as $$
+begin
+    update public.chat_sessions s
+    set message_count = greatest(s.message_count - c.n, 0)
+    from (select session_id, count(*) as n from deleted group by session_id) c
+    where s.id = c.session_id;
+    return null;
+end;
+$$;
+
+drop trigger if exists chat_messages_count_inserted on public.chat_messages;
+create trigger chat_messages_count_inserted
+    after insert on public.chat_messages
+    referencing new table as inserted
+    for each statement execute function public.chat_messages_count_inserted();
+
+drop trigger if exists chat_messages_count_deleted on public.chat_messages;
+create trigger chat_messages_count_deleted
+    after delete on public.chat_messages
+    referencing old table as deleted
+    for each statement execute function public.chat_messages_count_deleted();
+
+-- ---------- Tombstone ของแชทที่ถูกลบ ----------
+-- สร้างจาก chat_sessions เพื่อให้ชนิดของ id / user_id ตรงกับตารางจริง
+
+create table if not exists public.chat_session_deletions as
+    select id as session_id, user_id, now() as deleted_at
+    from public.chat_sessions
+    with no data;
+
+create index if not exists chat_session_deletions_user_deleted_at_idx
+    on public.chat_session_deletions (user_id, deleted_at);
+
+alter table public.chat_session_deletions enable row level security;
+
+drop policy if exists "Users read own session deletions" on public.chat_session_deletions;
+create policy "Users read own session deletions"
+    on public.chat_session_deletions
+    for select
+    using (user_id::text = auth.uid()::text);
+
+-- security definer: ผู้ใช้ไม่มีสิทธิ์ insert ตาราง tombstone เอง
+create or replace function public.chat_sessions_record_deletion()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into public.chat_session_deletions (session_id, user_id, deleted_at)
+    select id, user_id, now() from deleted;
+    return null;
+end;
+$$;
+
+drop trigger if exists chat_sessions_record_deletion on public.chat_sessions;
+create trigger chat_sessions_record_deletion
+    after delete on public.chat_sessions
+    referencing old table as deleted
+    for each statement execute function public.chat_sessions_record_deletion();
+
+-- tombstone เก่ากว่าช่วงที่ client จะ sync ไม่จำเป็นแล้ว ลบเป็นระยะได้ เช่น
+--     delete from public.chat_session_deletions where deleted_at < now() - interval '30 days';
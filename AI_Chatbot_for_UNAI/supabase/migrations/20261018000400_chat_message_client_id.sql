@@ -0,0 +1,77 @@
+-- ============================================================
+-- client_id ของข้อความ: id ที่แอปสร้างให้ข้อความใหม่แต่ละข้อความ (เก็บใน journal ของ write_behind.py)
+-- ถ้าเขียน batch ล้มเหลวกลางทางแล้ว retry / replay ซ้ำ ข้อความที่เขียนไปแล้วจะไม่ถูก insert ซ้ำ
+-- (ใช้กับ logic.write_session_changes_rest() และ save_chat_changes ด้านล่าง)
+-- ============================================================
+
+alter table public.chat_messages
+    add column if not exists client_id uuid;
+
+-- ข้อความเดิมมี client_id เป็น null ซึ่งไม่ชนกันใน unique index
+create unique index if not exists chat_messages_client_id_key
+    on public.chat_messages (client_id);
+
+-- ---------- save_chat_changes: insert ข้อความแบบ on conflict (client_id) do nothing ----------
+-- เหมือน 20261018000300_save_chat_changes.sql ยกเว้นขั้นที่ 4
+
+create or replace function public.save_chat_changes(p_changes jsonb)
+returns integer
+language plpgsql
+security invoker
+set search_path = public
+as $$
+declare
+    v_change jsonb;
+    v_session public.chat_sessions%rowtype;
+    v_count integer;
+    v_inserted integer := 0;
+begin
+    for v_change in select value from jsonb_array_elements(p_changes)
+    loop
+        -- แปลงชนิดของ id / user_id / meta ตามคอลัมน์จริงของตาราง
+        -- meta เป็น JSON null เมื่อหัวแชทไม่เปลี่ยน (ไม่ใช่ SQL NULL จึงต้อง nullif ก่อน ไม่อย่างนั้น || จะได้ array)
+        v_session := jsonb_populate_record(
+            null::public.chat_sessions,
+            coalesce(nullif(v_change->'meta', 'null'::jsonb), '{}'::jsonb)
+                || jsonb_build_object('id', v_change->'session_id', 'user_id', v_change->'user_id')
+        );
+
+        -- 1. ลบแชท (ข้อความถูกลบตาม ON DELETE CASCADE)
+        if coalesce((v_change->>'delete')::boolean, false) then
+            delete from public.chat_sessions where id = v_session.id;
+            continue;
+        end if;
+
+        -- 2. หัวแชท (เฉพาะเมื่อเปลี่ยน)
+        if jsonb_typeof(v_change->'meta') = 'object' then
+            insert into public.chat_sessions (id, user_id, title, thread_id, created_at)
+            values (v_session.id, v_session.user_id, v_session.title, v_session.thread_id,
+                    coalesce(v_session.created_at, now()))
+            on conflict (id) do update
+                set title = excluded.title,
+                    thread_id = excluded.thread_id,
+                    created_at = excluded.created_at;
+        end if;
+
+        -- 3. ลบข้อความเดิมทั้งหมดก่อน (ถ้าประวัติถูกเขียนใหม่)
+        if coalesce((v_change->>'rewrite')::boolean, false) then
+            delete from public.chat_messages where session_id = v_session.id;
+        end if;
+
+        -- 4. ข้อความใหม่ (คงลำดับเดิม: created_at เท่ากันใน transaction เดียว จึงเรียงตาม id)
+        --    ข้อความที่มี client_id อยู่แล้ว (เขียนสำเร็จไปแล้วในครั้งก่อน) จะถูกข้าม
+        insert into public.chat_messages (session_id, role, content, client_id)
+        select v_session.id, m.role, m.content, m.client_id
+        from jsonb_populate_recordset(null::public.chat_messages,
+                                      coalesce(v_change->'messages', '[]'::jsonb))
+             with ordinality as m
+        order by m.ordinality
+        on conflict (client_id) do nothing;
+
+        get diagnostics v_count = row_count;
+        v_inserted := v_inserted + v_count;
+    end loop;
+
+    return v_inserted;
+end;
+$$;
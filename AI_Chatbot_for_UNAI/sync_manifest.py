@@ -0,0 +1,101 @@
+"""
+AI Chatbot for UNAI - Sync Manifest
+จำว่าไฟล์ไหนใน Google Drive ถูก upload เป็นไฟล์ไหนใน Pinecone Assistant
+เพื่อให้ upload_documents.py --sync ทำงานเฉพาะไฟล์ที่เปลี่ยน
+"""
+
+import json
+import os
+from typing import Dict, List
+
+MANIFEST_FILE = os.getenv('SYNC_MANIFEST', 'sync_manifest.json')
+
+# ============================================================
+# Functions
+# ============================================================
+
+def load_manifest(path: str = MANIFEST_FILE) -> Dict:
+    """
+    โหลด manifest รูปแบบ:
+    {"files": {drive_id: {"name", "modifiedTime", "md5Checksum", "assistant_file_ids"}},
+     "pending_delete": [assistant_file_id]}
+    pending_delete คือไฟล์เวอร์ชันเก่าใน Assistant ที่ลบไม่สำเร็จ (ลองลบใหม่ใน sync ครั้งถัดไป)
+    """
+    if not os.path.exists(path):
+        return {"files": {}, "pending_delete": []}
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest.setdefault("files", {})
+    manifest.setdefault("pending_delete", [])
+    return manifest
+
+def save_manifest(manifest: Dict, path: str = MANIFEST_FILE):
+    """บันทึก manifest แบบ atomic (เขียนไฟล์ชั่วคราวแล้ว rename)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def upload_name(drive_file: Dict) -> str:
+    """ชื่อไฟล์ที่ใช้ตอน upload ไปยัง Pinecone"""
+    return f"{drive_file['name'].replace('.pdf', '')}.pdf"
+
+def is_unchanged(entry: Dict, drive_file: Dict) -> bool:
+    """ไฟล์ใน Drive ยังเหมือนกับที่ upload ไว้หรือไม่ (Google Docs ไม่มี md5 จึงใช้ modifiedTime)"""
+    if not entry.get("assistant_file_ids"):
+        return False
+    if drive_file.get('md5Checksum') and entry.get('md5Checksum'):
+        return drive_file['md5Checksum'] == entry['md5Checksum']
+    if entry.get('modifiedTime'):
+        return drive_file.get('modifiedTime') == entry['modifiedTime']
+    return False
+
+def adopt_assistant_files(manifest: Dict, drive_files: List[Dict], assistant_files: List[Dict]):
+    """
+    ครั้งแรกที่ใช้ --sync (manifest ว่าง) ให้จับคู่ไฟล์ที่มีอยู่แล้วใน Assistant ตามชื่อ
+    ไฟล์เหล่านี้จะถูก upload ใหม่หนึ่งครั้ง แล้วลบของเดิม (รวมถึงไฟล์ซ้ำ)
+    """
+    ids_by_name = {}
+    for f in assistant_files:
+        ids_by_name.setdefault(f.get('name'), []).append(f.get('id'))
+
+    for drive_file in drive_files:
+        ids = ids_by_name.get(upload_name(drive_file))
+        if ids:
+            manifest["files"][drive_file['id']] = {
+                "name": drive_file['name'],
+                "modifiedTime": None,
+                "md5Checksum": None,
+                "assistant_file_ids": ids
+            }
+
+def plan_sync(manifest: Dict, drive_files: List[Dict]) -> Dict[str, List]:
+    """
+    เทียบ manifest กับไฟล์ใน Drive แล้วแบ่งเป็น
+    - new: ไฟล์ใหม่ / changed: ไฟล์ที่แก้ไข → ต้องดาวน์โหลดและ upload
+    - unchanged: ข้าม
+    - removed: drive_id ที่หายไปจาก Drive → ลบออกจาก Assistant
+    """
+    entries = manifest["files"]
+    plan = {"new": [], "changed": [], "unchanged": [], "removed": []}
+
+    for drive_file in drive_files:
+        entry = entries.get(drive_file['id'])
+        if entry is None:
+            plan["new"].append(drive_file)
+        elif is_unchanged(entry, drive_file):
+            plan["unchanged"].append(drive_file)
+        else:
+            plan["changed"].append(drive_file)
+
+    current_ids = {f['id'] for f in drive_files}
+    plan["removed"] = [drive_id for drive_id in entries if drive_id not in current_ids]
+    return plan
+
+def record_upload(manifest: Dict, drive_file: Dict, assistant_file_id: str):
+    manifest["files"][drive_file['id']] = {
+        "name": drive_file['name'],
+        "modifiedTime": drive_file.get('modifiedTime'),
+        "md5Checksum": drive_file.get('md5Checksum'),
+        "assistant_file_ids": [assistant_file_id]
+    }
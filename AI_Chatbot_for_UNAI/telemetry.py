@@ -0,0 +1,196 @@
+"""
+AI Chatbot for UNAI - Telemetry
+จับเวลาแต่ละขั้นตอนของการ rerun และการเรียก service ภายนอก (Supabase / Pinecone)
+- ทุก span จะถูกเขียนเป็น JSON หนึ่งบรรทัดผ่าน logger "unai.telemetry" (ติด tag user/session)
+- สรุป count / histogram แบบ Prometheus ลงไฟล์ (METRICS_FILE) หรือเปิด endpoint (METRICS_PORT)
+
+ตั้งค่าผ่าน .env:
+    TELEMETRY_LOG=stderr | off | <path>   ปลายทางของ structured log (default: stderr)
+    METRICS_FILE=<path>                    เขียนไฟล์ metrics (รูปแบบ Prometheus text)
+    METRICS_PORT=<port>                    เปิด http://<host>:<port>/metrics
+    METRICS_HOST=<host>                    interface ของ endpoint (default: 127.0.0.1, 0.0.0.0 = ทุก interface)
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TELEMETRY_LOG = os.getenv('TELEMETRY_LOG', 'stderr')
+METRICS_FILE = os.getenv('METRICS_FILE')
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '10'))
+
+# ขอบบนของ bucket (ms)
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+logger = logging.getLogger("unai.telemetry")
+_context = contextvars.ContextVar("telemetry_context", default={})
+_current_span = contextvars.ContextVar("telemetry_span", default=None)
+
+# ============================================================
+# Metrics Registry
+# ============================================================
+
+class MetricsRegistry:
+    """เก็บ count / sum / histogram ของแต่ละ span (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._last_flush = 0.0
+
+    def observe(self, name: str, duration_ms: float, status: str = "ok"):
+        with self._lock:
+            series = self._series.setdefault((name, status), {
+                "count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS_MS)
+            })
+            series["count"] += 1
+            series["sum"] += duration_ms
+            for i, bound in enumerate(BUCKETS_MS):
+                if duration_ms <= bound:
+                    series["buckets"][i] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: {**s, "buckets": list(s["buckets"])} for key, s in self._series.items()}
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# HELP unai_span_duration_ms Duration of app stages and external calls",
+            "# TYPE unai_span_duration_ms histogram",
+        ]
+        for (name, status), s in sorted(self.snapshot().items()):
+            labels = f'span="{name}",status="{status}"'
+            for bound, count in zip(BUCKETS_MS, s["buckets"]):
+                lines.append(f'unai_span_duration_ms_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'unai_span_duration_ms_bucket{{{labels},le="+Inf"}} {s["count"]}')
+            lines.append(f'unai_span_duration_ms_sum{{{labels}}} {s["sum"]:.3f}')
+            lines.append(f'unai_span_duration_ms_count{{{labels}}} {s["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def maybe_flush(self, path: str):
+        """เขียนไฟล์ metrics ไม่บ่อยกว่า METRICS_FLUSH_SECONDS (เขียนแบบ atomic)"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_flush < METRICS_FLUSH_SECONDS:
+                return
+            self._last_flush = now
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+registry = MetricsRegistry()
+
+# ============================================================
+# Spans
+# ============================================================
+
+def set_context(**tags):
+    """ตั้ง tag (เช่น user, session) ที่จะติดไปกับทุก span ของ rerun นี้"""
+    _context.set({k: v for k, v in tags.items() if v is not None})
+
+def record(name: str, duration_ms: float, status: str = "ok", **tags):
+    """บันทึกผลหนึ่ง span ลง registry และ structured log"""
+    registry.observe(name, duration_ms, status)
+    if logger.isEnabledFor(logging.INFO):
+        event = {"span": name, "ms": round(duration_ms, 2), "status": status,
+                 **_context.get(), **tags}
+        logger.info(json.dumps(event, ensure_ascii=False, default=str))
+    if METRICS_FILE:
+        try:
+            registry.maybe_flush(METRICS_FILE)
+        except OSError:
+            pass
+
+@contextmanager
+def span(name: str, **tags):
+    """
+    จับเวลาบล็อกโค้ด
+    exception ปกติถือว่า error แต่ st.rerun()/st.stop() (BaseException) ถือว่า ok
+    """
+    start = time.perf_counter()
+    state = {"status": "ok"}
+    token = _current_span.set(state)
+    try:
+        yield
+    except Exception:
+        state["status"] = "error"
+        raise
+    finally:
+        _current_span.reset(token)
+        record(name, (time.perf_counter() - start) * 1000, state["status"], **tags)
+
+def mark_error():
+    """
+    ให้ span ที่กำลังทำงานอยู่ถูกบันทึกเป็น error
+    ใช้ในฟังก์ชันที่จับ exception เองแล้วคืนค่าแทนการ raise (span จึงไม่เห็น exception)
+    """
+    state = _current_span.get()
+    if state is not None:
+        state["status"] = "error"
+
+def timed(name: str):
+    """decorator สำหรับจับเวลาฟังก์ชันที่เรียก service ภายนอก"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# ============================================================
+# Setup
+# ============================================================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_setup_lock = threading.Lock()
+_configured = False
+
+def configure():
+    """ตั้งค่า logger และ metrics endpoint (เรียกซ้ำได้ ทำงานครั้งเดียวต่อ process)"""
+    global _configured
+    with _setup_lock:
+        if _configured:
+            return
+        _configured = True
+
+        if TELEMETRY_LOG != "off":
+            if TELEMETRY_LOG == "stderr":
+                handler = logging.StreamHandler()
+            else:
+                handler = logging.FileHandler(TELEMETRY_LOG, encoding='utf-8')
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+        if METRICS_PORT:
+            try:
+                server = ThreadingHTTPServer((METRICS_HOST, int(METRICS_PORT)), _MetricsHandler)
+            except OSError as e:
+                logger.warning(f"Metrics endpoint disabled: {e}")
+                return
+            threading.Thread(target=server.serve_forever, daemon=True).start()
@@ -3,11 +3,18 @@ AI Chatbot for UNAI - Document Upload Script
 สำหรับ upload เอกสารจาก Google Drive ไปยัง Pinecone Assistant
 """
 
+import argparse
 import io
+import queue
+import sys
+import tempfile
 import time
 import os
-from typing import Dict, Any, List
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional
 import requests
+from requests.adapters import HTTPAdapter
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
@@ -15,9 +22,17 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
 from pinecone import Pinecone
-from pinecone_plugins.assistant.models.chat import Message
 import pickle
 from dotenv import load_dotenv
+from sync_manifest import (
+    load_manifest,
+    save_manifest,
+    adopt_assistant_files,
+    plan_sync,
+    record_upload
+)
+import local_index
+from local_index import ChunkSpool, extract_pdf_pages, update_index, LOCAL_INDEX_PATH
 
 # Load environment variables
 load_dotenv()
@@ -28,9 +43,17 @@ load_dotenv()
 PINECONE_API_KEY = os.getenv('PINECONE_API_KEY')
 ASSISTANT_NAME = os.getenv('ASSISTANT_NAME', 'unai-chatbot')
 FOLDER_ID = os.getenv('FOLDER_ID')
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '4'))
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '4'))
+UPLOAD_MAX_RETRIES = int(os.getenv('UPLOAD_MAX_RETRIES', '5'))
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '4'))
+# --sync จะไม่ลบเอกสารเกินสัดส่วนนี้ของ manifest ในครั้งเดียว (เว้นแต่ใช้ --allow-mass-delete)
+SYNC_MAX_REMOVE_FRACTION = float(os.getenv('SYNC_MAX_REMOVE_FRACTION', '0.5'))
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024  # ไฟล์ที่ใหญ่กว่านี้จะถูกพักไว้บน disk
 
 # Google Drive API scopes
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+GOOGLE_DOC_MIME = 'application/vnd.google-apps.document'
 
 # ============================================================
 # Functions
@@ -42,7 +65,7 @@ def print_header(title: str):
     print(f"  {title}")
     print("="*60 + "\n")
 
-def authenticate_google_drive():
+def get_google_credentials():
     """
     Authenticate กับ Google Drive API
     ครั้งแรกจะเปิด browser ให้ login
@@ -86,7 +109,11 @@ def authenticate_google_drive():
             pickle.dump(creds, token)
     
     print("✅ Google Drive authenticated successfully\n")
-    return build('drive', 'v3', credentials=creds)
+    return creds
+
+def build_drive_service(creds):
+    """สร้าง Drive service (httplib2 ไม่ thread-safe จึงต้องแยกต่อ thread)"""
+    return build('drive', 'v3', credentials=creds, cache_discovery=False)
 
 def initialize_pinecone(api_key: str, assistant_name: str):
     """Initialize Pinecone และสร้าง/เชื่อมต่อ Assistant"""
@@ -126,135 +153,681 @@ def initialize_pinecone(api_key: str, assistant_name: str):
     
     return assistant
 
-def list_documents_in_folder(drive_service, folder_id: str) -> List[Dict]:
-    """ดึงรายชื่อเอกสารทั้งหมดจาก Google Drive folder"""
-    print(f"📂 Scanning Google Drive folder...")
-    print(f"   Folder ID: {folder_id}\n")
+def list_drive_files(drive_service, folder_id: str) -> List[Dict]:
+    """ดึงรายชื่อเอกสารทั้งหมดใน folder (อ่านครบทุกหน้าตาม nextPageToken)"""
+    # ค้นหาทั้ง PDF และ Google Docs
+    query = (
+        f"'{folder_id}' in parents and trashed=false and "
+        f"(mimeType='application/pdf' or "
+        f"mimeType='{GOOGLE_DOC_MIME}')"
+    )
     
-    try:
-        # ค้นหาทั้ง PDF และ Google Docs
-        query = (
-            f"'{folder_id}' in parents and "
-            f"(mimeType='application/pdf' or "
-            f"mimeType='application/vnd.google-apps.document')"
-        )
-        
+    files = []
+    page_token = None
+    while True:
         results = drive_service.files().list(
             q=query,
             spaces='drive',
-            fields='nextPageToken, files(id, name, mimeType)'
+            pageSize=1000,
+            pageToken=page_token,
+            fields='nextPageToken, files(id, name, mimeType, modifiedTime, md5Checksum)'
         ).execute()
         
-        files = results.get('files', [])
-        
-        if not files:
-            print("⚠️  No documents found in folder\n")
-            return []
-        
-        print(f"📄 Found {len(files)} document(s):")
-        for idx, file in enumerate(files, 1):
-            file_type = "PDF" if "pdf" in file['mimeType'] else "Google Doc"
-            print(f"   {idx}. {file['name']} ({file_type})")
-        print()
-        
-        # ดาวน์โหลดแต่ละไฟล์
-        documents = []
-        for idx, item in enumerate(files, 1):
-            print(f"[{idx}/{len(files)}] Processing: {item['name']}")
-            
-            # ถ้าเป็น Google Doc ให้ export เป็น PDF
-            if item['mimeType'] == 'application/vnd.google-apps.document':
-                print(f"   → Converting Google Doc to PDF...")
-                request = drive_service.files().export_media(
-                    fileId=item['id'],
-                    mimeType='application/pdf'
-                )
-            else:
-                print(f"   → Downloading PDF...")
-                request = drive_service.files().get_media(fileId=item['id'])
-            
-            # ดาวน์โหลดไฟล์
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-                if status:
-                    progress = int(status.progress() * 100)
-                    print(f"   → Progress: {progress}%", end='\r')
-            
-            fh.seek(0)
-            documents.append({
-                'id': item['id'],
-                'name': item['name'].replace('.pdf', ''),
-                'pdf_content': fh.getvalue()
-            })
-            print(f"   ✅ Downloaded successfully\n")
-        
-        return documents
-        
+        files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return files
+
+_thread_local = threading.local()
+
+def _thread_drive_service(creds):
+    """Drive service ของ thread ปัจจุบัน (สร้างครั้งเดียวต่อ thread)"""
+    service = getattr(_thread_local, 'drive_service', None)
+    if service is None:
+        service = build_drive_service(creds)
+        _thread_local.drive_service = service
+    return service
+
+def download_document(drive_service, item: Dict, fh) -> None:
+    """ดาวน์โหลดไฟล์จาก Drive ลง file object (Google Doc จะ export เป็น PDF)"""
+    if item['mimeType'] == GOOGLE_DOC_MIME:
+        request = drive_service.files().export_media(
+            fileId=item['id'],
+            mimeType='application/pdf'
+        )
+    else:
+        request = drive_service.files().get_media(fileId=item['id'])
+    
+    downloader = MediaIoBaseDownload(fh, request)
+    done = False
+    while not done:
+        _, done = downloader.next_chunk(num_retries=3)
+    fh.seek(0)
+
+def download_documents(creds, files: List[Dict], workers: int = DOWNLOAD_WORKERS) -> List[Dict]:
+    """ดาวน์โหลดหลายไฟล์พร้อมกันด้วย thread pool (แสดงความคืบหน้าทีละไฟล์)"""
+    print(f"⬇️  Downloading {len(files)} document(s) with {workers} worker(s)...\n")
+    print_lock = threading.Lock()
+    completed = 0
+    
+    def fetch(item):
+        fh = io.BytesIO()
+        download_document(_thread_drive_service(creds), item, fh)
+        return {
+            'id': item['id'],
+            'name': item['name'].replace('.pdf', ''),
+            'pdf_content': fh.getvalue()
+        }
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch, item): item for item in files}
+        for future in as_completed(futures):
+            item = futures[future]
+            completed += 1
+            with print_lock:
+                try:
+                    results[item['id']] = future.result()
+                    size_kb = len(results[item['id']]['pdf_content']) / 1024
+                    print(f"[{completed}/{len(files)}] ✅ {item['name']} ({size_kb:.0f} KB)")
+                except Exception as e:
+                    print(f"[{completed}/{len(files)}] ❌ {item['name']}: {str(e)}")
+    print()
+    
+    # คืนผลตามลำดับเดิมของ folder
+    return [results[item['id']] for item in files if item['id'] in results]
+
+def scan_drive_folder(creds, folder_id: str) -> List[Dict]:
+    """ดึงรายชื่อเอกสารทั้งหมดจาก Google Drive folder (ยังไม่ดาวน์โหลด)"""
+    print(f"📂 Scanning Google Drive folder...")
+    print(f"   Folder ID: {folder_id}\n")
+    
+    try:
+        files = list_drive_files(build_drive_service(creds), folder_id)
     except HttpError as error:
         print(f'❌ Google Drive API error: {error}\n')
         return []
+    
+    if not files:
+        print("⚠️  No documents found in folder\n")
+        return []
+    
+    print(f"📄 Found {len(files)} document(s):")
+    for idx, file in enumerate(files, 1):
+        file_type = "PDF" if "pdf" in file['mimeType'] else "Google Doc"
+        print(f"   {idx}. {file['name']} ({file_type})")
+    print()
+    return files
+
+def get_files_url(assistant_name: str) -> str:
+    return f"https://prod-1-data.ke.pinecone.io/assistant/files/{assistant_name}"
+
+def create_upload_session(workers: int = UPLOAD_WORKERS) -> requests.Session:
+    """HTTP session ที่ใช้ connection pool ร่วมกันทุก upload worker"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('https://', adapter)
+    return session
+
+class AdaptiveBackoff:
+    """
+    หน่วงเวลาร่วมกันทุก worker แทนการ sleep คงที่
+    - เจอ 429/5xx: เพิ่มเวลาหน่วงเป็น 2 เท่า (หรือตาม Retry-After)
+    - upload สำเร็จ: ลดเวลาหน่วงลงครึ่งหนึ่งจนเหลือ 0
+    """
+
+    def __init__(self, initial: float = 1.0, maximum: float = 60.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.delay = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            delay = self.delay
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        with self._lock:
+            self.delay = min(max(self.delay * 2, self.initial), self.maximum)
+            if retry_after:
+                self.delay = max(self.delay, min(retry_after, self.maximum))
+
+    def on_success(self):
+        with self._lock:
+            self.delay = self.delay / 2 if self.delay >= 0.2 else 0.0
+
+def _retry_after(response) -> Optional[float]:
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+class KnownFiles:
+    """
+    id ของไฟล์ที่มีอยู่ใน Assistant ก่อนเริ่ม upload รวมกับไฟล์ที่ upload ในรอบนี้
+    ใช้หาไฟล์ที่ server รับไปแล้วแต่เราไม่ได้คำตอบ (timeout / 5xx) แทนการ upload ซ้ำ
+    (ชื่อไฟล์อย่างเดียวไม่พอ เพราะเวอร์ชันเก่าของไฟล์ที่แก้ไขก็ใช้ชื่อเดียวกัน)
+    """
+
+    def __init__(self, api_key: str, assistant_name: str, session=None):
+        self.api_key = api_key
+        self.assistant_name = assistant_name
+        self.session = session
+        self._lock = threading.Lock()
+        try:
+            self._ids = {f.get('id') for f in list_assistant_files(api_key, assistant_name, session)}
+        except requests.RequestException as e:
+            print(f"   ⚠️  Could not list assistant files, uploads will not be retried after a timeout: {str(e)}")
+            self._ids = None
+
+    @property
+    def available(self) -> bool:
+        return self._ids is not None
+
+    def add(self, file_id: str):
+        with self._lock:
+            if self._ids is not None:
+                self._ids.add(file_id)
+
+    def find_uploaded(self, filename: str) -> Optional[Dict]:
+        """ไฟล์ชื่อนี้ที่เพิ่งปรากฏใน Assistant (ยังไม่มีใครรับไป) หรือ None (raise ถ้าดึงรายการไม่ได้)"""
+        files = list_assistant_files(self.api_key, self.assistant_name, self.session)
+        with self._lock:
+            for f in files:
+                if f.get('name') == filename and f.get('id') not in self._ids:
+                    self._ids.add(f['id'])
+                    return f
+        return None
 
 def upload_to_pinecone(
     api_key: str,
     assistant_name: str,
-    pdf_document: Dict[str, Any]
-) -> bool:
-    """Upload PDF ไปยัง Pinecone Assistant"""
-    url = f"https://prod-1-data.ke.pinecone.io/assistant/files/{assistant_name}"
+    pdf_document: Dict[str, Any],
+    session: Optional[requests.Session] = None,
+    backoff: Optional[AdaptiveBackoff] = None,
+    known: Optional[KnownFiles] = None
+) -> Optional[Dict]:
+    """
+    Upload PDF ไปยัง Pinecone Assistant คืนข้อมูลไฟล์ (id, status) ถ้าสำเร็จ
+    การ upload ไม่ idempotent จึง retry ทันทีเฉพาะ 429 และกรณีที่ยังต่อ server ไม่ได้
+    ส่วน timeout / connection หลุด / 5xx (server อาจรับไฟล์ไปแล้ว) จะเช็คกับ known ก่อน upload ใหม่
+    """
+    url = get_files_url(assistant_name)
     headers = {"Api-Key": api_key}
-    file_obj = io.BytesIO(pdf_document['pdf_content'])
     filename = f"{pdf_document['name']}.pdf"
+    http = session or requests
+    backoff = backoff or AdaptiveBackoff()
     
+    for attempt in range(UPLOAD_MAX_RETRIES + 1):
+        backoff.wait()
+        # เอกสารจาก pipeline มาเป็นไฟล์ชั่วคราว ('file') ส่วนแบบเดิมเป็น bytes
+        if 'file' in pdf_document:
+            file_obj = pdf_document['file']
+            file_obj.seek(0)
+        else:
+            file_obj = io.BytesIO(pdf_document['pdf_content'])
+        retry_after = None
+        try:
+            response = http.post(
+                url,
+                headers=headers,
+                files={'file': (filename, file_obj, 'application/pdf')},
+                timeout=60
+            )
+            # 429 = server ปฏิเสธโดยไม่ได้สร้างไฟล์ ให้รอแล้วลองใหม่
+            if response.status_code == 429 and attempt < UPLOAD_MAX_RETRIES:
+                backoff.on_throttle(_retry_after(response))
+                continue
+            if response.status_code >= 500:
+                error, retry_after = f"HTTP {response.status_code}", _retry_after(response)
+            else:
+                response.raise_for_status()
+                backoff.on_success()
+                file_info = response.json()
+                if known:
+                    known.add(file_info.get('id'))
+                return file_info
+        except requests.ConnectTimeout as e:
+            # ยังต่อ server ไม่ได้ request จึงยังไม่ถูกส่ง
+            if attempt < UPLOAD_MAX_RETRIES:
+                backoff.on_throttle()
+                continue
+            print(f"   ❌ Upload failed: {filename}: {str(e)}")
+            return None
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = str(e)
+        except requests.RequestException as e:
+            print(f"   ❌ Upload failed: {filename}: {str(e)}")
+            return None
+        finally:
+            if 'file' not in pdf_document:
+                file_obj.close()
+        
+        # ไม่รู้ว่า server รับไฟล์ไปแล้วหรือยัง: ดูรายการไฟล์ก่อน upload ซ้ำ
+        if attempt >= UPLOAD_MAX_RETRIES or not (known and known.available):
+            print(f"   ❌ Upload failed: {filename}: {error} (the file may still have been uploaded)")
+            return None
+        backoff.on_throttle(retry_after)
+        backoff.wait()
+        try:
+            file_info = known.find_uploaded(filename)
+        except requests.RequestException as e:
+            print(f"   ❌ Upload failed: {filename}: {error}, could not check assistant files: {str(e)}")
+            return None
+        if file_info:
+            return file_info
+    return None
+
+def document_size(doc: Dict) -> int:
+    return doc['size'] if 'size' in doc else len(doc['pdf_content'])
+
+def upload_documents_to_pinecone(
+    api_key: str,
+    assistant_name: str,
+    documents: List[Dict],
+    workers: int = UPLOAD_WORKERS
+) -> List[Dict]:
+    """Upload หลายไฟล์พร้อมกัน คืนรายการไฟล์ที่ upload สำเร็จ"""
+    session = create_upload_session(workers)
+    backoff = AdaptiveBackoff()
+    known = KnownFiles(api_key, assistant_name, session)
+    print_lock = threading.Lock()
+    completed = 0
+    uploaded = []
+    total_bytes = 0
+    start_time = time.time()
+    
+    def upload(doc):
+        return upload_to_pinecone(api_key, assistant_name, doc, session, backoff, known)
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(upload, doc): doc for doc in documents}
+        for future in as_completed(futures):
+            doc = futures[future]
+            completed += 1
+            file_info = future.result()
+            with print_lock:
+                if file_info:
+                    uploaded.append({'document': doc, 'file': file_info})
+                    total_bytes += document_size(doc)
+                    print(f"[{completed}/{len(documents)}] ✅ {doc['name']}")
+                else:
+                    print(f"[{completed}/{len(documents)}] ❌ {doc['name']}")
+    
+    session.close()
+    print_throughput(len(uploaded), total_bytes, time.time() - start_time)
+    return uploaded
+
+def print_throughput(file_count: int, total_bytes: int, elapsed: float):
+    """สรุปความเร็วในการ upload"""
+    elapsed = max(elapsed, 1e-6)
+    print(f"\n⚡ Uploaded {file_count} file(s), {total_bytes / 1024 / 1024:.1f} MB "
+          f"in {elapsed:.1f}s ({file_count / elapsed:.2f} files/s, "
+          f"{total_bytes / 1024 / 1024 / elapsed:.2f} MB/s)\n")
+
+def run_ingestion_pipeline(
+    creds,
+    files: List[Dict],
+    api_key: str,
+    assistant_name: str,
+    download_workers: int = DOWNLOAD_WORKERS,
+    upload_workers: int = UPLOAD_WORKERS,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    spool: Optional[ChunkSpool] = None
+) -> List[Dict]:
+    """
+    ดาวน์โหลดและ upload แบบ pipeline เชื่อมกันด้วย queue ที่จำกัดขนาด
+    - ไฟล์ถูกพักใน SpooledTemporaryFile (memory ถ้าเล็ก, disk ถ้าใหญ่) แค่ช่วงสั้นๆ
+    - upload เสร็จแล้วปิดไฟล์ทันที (ถ้ามี spool จะดึงข้อความลง spool สำหรับ local index ก่อนปิด)
+    - ถ้า queue เต็ม ฝั่งดาวน์โหลดจะรอ ทำให้ใช้ memory คงที่ไม่ว่า folder จะใหญ่แค่ไหน
+    """
+    print(f"🚚 Pipeline: {download_workers} download / {upload_workers} upload worker(s), "
+          f"queue size {queue_size}\n")
+    pending = queue.Queue(maxsize=queue_size)
+    session = create_upload_session(upload_workers)
+    backoff = AdaptiveBackoff()
+    known = KnownFiles(api_key, assistant_name, session)
+    print_lock = threading.Lock()
+    uploaded = []
+    stats = {'completed': 0, 'bytes': 0}
+    start_time = time.time()
+    
+    def report(doc_name, ok, detail=""):
+        with print_lock:
+            stats['completed'] += 1
+            icon = "✅" if ok else "❌"
+            print(f"[{stats['completed']}/{len(files)}] {icon} {doc_name}{detail}")
+    
+    def download(item):
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        try:
+            download_document(_thread_drive_service(creds), item, spool)
+        except Exception as e:
+            spool.close()
+            report(item['name'], False, f": download failed: {str(e)}")
+            return
+        spool.seek(0, os.SEEK_END)
+        size = spool.tell()
+        pending.put({
+            'id': item['id'],
+            'name': item['name'].replace('.pdf', ''),
+            'file': spool,
+            'size': size
+        })
+    
+    def upload_worker():
+        while True:
+            doc = pending.get()
+            if doc is None:
+                return
+            try:
+                file_info = upload_to_pinecone(api_key, assistant_name, doc, session, backoff, known)
+                if file_info and spool is not None:
+                    spool_document_text(spool, doc)
+            except Exception as e:
+                print(f"   ❌ Upload failed: {doc['name']}: {str(e)}")
+                file_info = None
+            finally:
+                doc['file'].close()
+            if file_info:
+                document = {'id': doc['id'], 'name': doc['name'], 'size': doc['size']}
+                with print_lock:
+                    uploaded.append({'document': document, 'file': file_info})
+                    stats['bytes'] += doc['size']
+            report(doc['name'], bool(file_info), f" ({doc['size'] / 1024:.0f} KB)")
+    
+    uploaders = [threading.Thread(target=upload_worker, daemon=True) for _ in range(upload_workers)]
+    for thread in uploaders:
+        thread.start()
+    
+    with ThreadPoolExecutor(max_workers=download_workers) as executor:
+        list(executor.map(download, files))
+    
+    # บอก upload worker ว่าหมดงานแล้ว
+    for _ in uploaders:
+        pending.put(None)
+    for thread in uploaders:
+        thread.join()
+    
+    session.close()
+    print_throughput(len(uploaded), stats['bytes'], time.time() - start_time)
+    return uploaded
+
+def ingest_documents(
+    creds,
+    files: List[Dict],
+    api_key: str,
+    assistant_name: str,
+    pipeline: bool = True,
+    spool: Optional[ChunkSpool] = None
+) -> List[Dict]:
+    """
+    ดาวน์โหลดและ upload ไฟล์ (pipeline หรือแบบดาวน์โหลดทั้งหมดก่อนแล้วค่อย upload)
+    spool: ถ้ามี จะดึงข้อความของไฟล์ที่ upload สำเร็จลง spool สำหรับ local index
+    """
+    if pipeline:
+        print_header("🚚 Downloading & Uploading Documents")
+        return run_ingestion_pipeline(creds, files, api_key, assistant_name, spool=spool)
+    
+    documents = download_documents(creds, files)
+    print_header("📤 Uploading Documents to Pinecone")
+    uploaded = upload_documents_to_pinecone(api_key, assistant_name, documents)
+    if spool is not None:
+        for item in uploaded:
+            spool_document_text(spool, item['document'])
+    return uploaded
+
+# ============================================================
+# Local Search Index
+# ============================================================
+
+def extract_document_text(doc: Dict) -> Optional[List[str]]:
+    """ดึงข้อความแต่ละหน้าจาก PDF (คืน None ถ้าดึงไม่ได้ เช่น ไฟล์สแกน/เสียหาย)"""
     try:
-        response = requests.post(
-            url,
-            headers=headers,
-            files={'file': (filename, file_obj, 'application/pdf')},
+        return extract_pdf_pages(doc['file'] if 'file' in doc else doc['pdf_content'])
+    except Exception as e:
+        print(f"   ⚠️  Text extraction failed: {doc['name']}: {str(e)}")
+        return None
+
+def spool_document_text(spool: ChunkSpool, doc: Dict):
+    """ดึงข้อความของเอกสารที่เพิ่ง upload ลง spool ทันที (ไม่เก็บข้อความไว้กับผลการ upload)"""
+    pages = extract_document_text(doc)
+    if pages is not None:
+        spool.add(doc['id'], doc['name'], pages)
+
+def update_local_index(spool: ChunkSpool, removed_ids: List[str] = (), replace: bool = False):
+    """อัปเดตดัชนี BM25 บนเครื่อง (local_index.py) ด้วยเอกสารที่ upload สำเร็จ"""
+    if not spool.doc_ids and not removed_ids and not replace:
+        return
+    
+    print_header("🔎 Updating Local Search Index")
+    try:
+        index = update_index(spool, removed_ids, replace)
+    except Exception as e:
+        print(f"❌ Error building local index: {str(e)}\n")
+        return
+    print(f"✅ {len(index.document_ids())} document(s), {len(index.chunks)} passage(s) → {LOCAL_INDEX_PATH}\n")
+
+def list_assistant_files(api_key: str, assistant_name: str, session=None) -> List[Dict]:
+    """ดึงรายการไฟล์ที่อยู่ใน Assistant"""
+    http = session or requests
+    response = http.get(get_files_url(assistant_name), headers={"Api-Key": api_key}, timeout=60)
+    response.raise_for_status()
+    return response.json().get('files', [])
+
+def delete_from_pinecone(api_key: str, assistant_name: str, file_id: str, session=None) -> bool:
+    """ลบไฟล์ออกจาก Assistant (ไฟล์ที่ไม่มีอยู่แล้วถือว่าสำเร็จ)"""
+    http = session or requests
+    try:
+        response = http.delete(
+            f"{get_files_url(assistant_name)}/{file_id}",
+            headers={"Api-Key": api_key},
             timeout=60
         )
+        if response.status_code == 404:
+            return True
         response.raise_for_status()
         return True
     except requests.RequestException as e:
-        print(f"   ❌ Upload failed: {str(e)}")
+        print(f"   ❌ Delete failed: {file_id}: {str(e)}")
         return False
-    finally:
-        file_obj.close()
 
-def wait_for_processing(assistant, max_wait_time=180):
-    """รอให้ Pinecone ประมวลผลไฟล์เสร็จ"""
-    print("⏳ Waiting for Pinecone to process files...")
+def sync_documents(
+    creds,
+    folder_id: str,
+    api_key: str,
+    assistant_name: str,
+    pipeline: bool = True,
+    build_index: bool = False,
+    allow_mass_delete: bool = False
+) -> List[Dict]:
+    """
+    Sync แบบ incremental ด้วย manifest
+    - ข้ามไฟล์ที่ไม่เปลี่ยน (md5/modifiedTime เท่าเดิม)
+    - upload ไฟล์ใหม่/ไฟล์ที่แก้ไข แล้วลบเวอร์ชันเก่าใน Assistant
+    - ลบไฟล์ใน Assistant ที่ต้นฉบับใน Drive ถูกลบไปแล้ว
+      (ถ้า Drive ว่างเปล่าหรือจะลบเกิน SYNC_MAX_REMOVE_FRACTION จะไม่ลบ เว้นแต่ allow_mass_delete)
+    คืนรายการไฟล์ที่ upload ใหม่
+    """
+    print(f"📂 Scanning Google Drive folder...")
+    print(f"   Folder ID: {folder_id}\n")
+    
+    try:
+        drive_files = list_drive_files(build_drive_service(creds), folder_id)
+    except HttpError as error:
+        print(f'❌ Google Drive API error: {error}\n')
+        return []
+    
+    manifest = load_manifest()
+    if not manifest["files"]:
+        # ครั้งแรก: จับคู่กับไฟล์ที่ upload ไว้แล้ว เพื่อไม่ให้เกิดไฟล์ซ้ำ
+        adopt_assistant_files(manifest, drive_files, list_assistant_files(api_key, assistant_name))
+    
+    plan = plan_sync(manifest, drive_files)
+    
+    # Drive คืนรายการว่างโดยไม่ error ได้ (token ของบัญชีอื่น, สิทธิ์ถูกยกเลิก, FOLDER_ID ผิด)
+    # ถ้าเชื่อรายการนั้นจะลบเอกสารทั้งหมดออกจาก Assistant และ local index
+    removed_count, known_count = len(plan['removed']), len(manifest["files"])
+    if removed_count and not allow_mass_delete and \
+            (not drive_files or removed_count > known_count * SYNC_MAX_REMOVE_FRACTION):
+        print(f"⚠️  Refusing to remove {removed_count} of {known_count} document(s): "
+              f"Drive returned {len(drive_files)} file(s).")
+        print("   Check FOLDER_ID and the Google account, or run again with --allow-mass-delete\n")
+        plan['removed'] = []
+    
+    print(f"🔄 Sync plan: {len(plan['new'])} new, {len(plan['changed'])} changed, "
+          f"{len(plan['unchanged'])} unchanged, {len(plan['removed'])} removed\n")
+    
+    to_upload = plan['new'] + plan['changed']
+    drive_by_id = {f['id']: f for f in to_upload}
+    uploaded = []
+    session = create_upload_session()
+    spool = ChunkSpool() if build_index else None
+    
+    # เวอร์ชันเก่าที่ลบไม่สำเร็จในรอบก่อน
+    if manifest["pending_delete"]:
+        print(f"🗑️  Retrying {len(manifest['pending_delete'])} pending deletes")
+        manifest["pending_delete"] = [
+            file_id for file_id in manifest["pending_delete"]
+            if not delete_from_pinecone(api_key, assistant_name, file_id, session)
+        ]
+        save_manifest(manifest)
+    
+    if to_upload:
+        uploaded = ingest_documents(creds, to_upload, api_key, assistant_name, pipeline, spool)
+        
+        for item in uploaded:
+            drive_file = drive_by_id[item['document']['id']]
+            # ลบเวอร์ชันเก่าหลัง upload เวอร์ชันใหม่สำเร็จแล้วเท่านั้น
+            previous = manifest["files"].get(drive_file['id'], {})
+            for old_id in previous.get("assistant_file_ids", []):
+                if not delete_from_pinecone(api_key, assistant_name, old_id, session):
+                    # จำไว้ลบใน sync ครั้งถัดไป ไม่อย่างนั้น record_upload จะเขียนทับแล้ว id นี้จะค้างใน Assistant
+                    manifest["pending_delete"].append(old_id)
+            record_upload(manifest, drive_file, item['file']['id'])
+            save_manifest(manifest)
+    
+    for drive_id in plan['removed']:
+        entry = manifest["files"][drive_id]
+        print(f"🗑️  Removing {entry['name']} (deleted from Drive)")
+        if all(delete_from_pinecone(api_key, assistant_name, file_id, session)
+               for file_id in entry.get("assistant_file_ids", [])):
+            del manifest["files"][drive_id]
+    
+    session.close()
+    save_manifest(manifest)
+    
+    if spool is not None:
+        update_local_index(spool, plan['removed'])
+        spool.close()
+    
+    print_header("✅ Sync Summary")
+    print(f"Uploaded: {len(uploaded)}/{len(to_upload)}")
+    print(f"Skipped (unchanged): {len(plan['unchanged'])}")
+    print(f"Removed: {len(plan['removed'])}")
+    print(f"Pending delete: {len(manifest['pending_delete'])}\n")
+    return uploaded
+
+def print_status_table(files: List[Dict], statuses: Dict[str, Dict], redraw_lines: int) -> int:
+    """แสดงตารางสถานะไฟล์ (วาดทับตารางเดิมถ้าเป็น terminal) คืนจำนวนบรรทัดที่พิมพ์"""
+    icons = {"Available": "✅", "Processing": "⏳"}
+    lines = [f"   {'Status':<18} {'Name'}"]
+    for f in files:
+        info = statuses.get(f['id'], {})
+        status = info.get('status', 'Unknown')
+        icon = icons.get(status, "❌" if "Failed" in status else "❔")
+        progress = info.get('percent_done')
+        detail = f" {progress * 100:.0f}%" if status == "Processing" and progress else ""
+        if info.get('error_message'):
+            detail = f" ({info['error_message']})"
+        lines.append(f"   {icon} {status + detail:<16} {f.get('name')}")
+    
+    if redraw_lines and sys.stdout.isatty():
+        print(f"\033[{redraw_lines}F\033[J", end='')
+    print("\n".join(lines))
+    return len(lines)
+
+def wait_for_processing(
+    api_key: str,
+    assistant_name: str,
+    uploaded: List[Dict],
+    max_wait_time: int = 900,
+    initial_delay: float = 2.0,
+    max_delay: float = 30.0
+) -> bool:
+    """
+    รอให้ Pinecone ประมวลผลไฟล์ที่ upload เสร็จ โดยดูสถานะรายไฟล์จาก files API
+    (ไม่ต้องส่งแชททดสอบ) ถามซ้ำแบบ exponential backoff และหยุดทันทีเมื่อทุกไฟล์เสร็จ
+    """
+    print("⏳ Waiting for Pinecone to process files...\n")
+    files = [item['file'] for item in uploaded]
+    pending_ids = {f['id'] for f in files}
     start_time = time.time()
+    delay = initial_delay
+    drawn = 0
     
-    while time.time() - start_time < max_wait_time:
+    while True:
         try:
-            # ทดสอบว่าไฟล์พร้อมหรือยัง
-            test_msg = Message(content="test")
-            assistant.chat(messages=[test_msg])
+            statuses = {
+                f['id']: f for f in list_assistant_files(api_key, assistant_name)
+                if f.get('id') in pending_ids
+            }
+        except requests.RequestException as e:
+            print(f"   ⚠️  Could not fetch file status: {str(e)}")
+            statuses = {}
+            drawn = 0
+        else:
+            drawn = print_status_table(files, statuses, drawn)
+        
+        done = [s for s in statuses.values() if s.get('status') != "Processing"]
+        if statuses and len(done) == len(pending_ids):
             elapsed = int(time.time() - start_time)
-            print(f"✅ Files processed successfully! (took {elapsed}s)\n")
-            return True
-        except Exception as e:
-            error_msg = str(e)
-            if "still be processing" in error_msg or "No files found" in error_msg:
-                elapsed = int(time.time() - start_time)
-                print(f"   Still processing... ({elapsed}s elapsed)", end='\r')
-                time.sleep(10)
-            else:
-                print(f"\n❌ Unexpected error: {error_msg}\n")
+            failed = [s for s in done if s.get('status') != "Available"]
+            if failed:
+                print(f"\n⚠️  {len(failed)} file(s) failed to process (took {elapsed}s)\n")
                 return False
-    
-    print(f"\n⚠️  Timeout after {max_wait_time}s\n")
-    return False
+            print(f"\n✅ Files processed successfully! (took {elapsed}s)\n")
+            return True
+        
+        if time.time() - start_time + delay > max_wait_time:
+            print(f"\n⚠️  Timeout after {max_wait_time}s\n")
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
 
 # ============================================================
 # Main Function
 # ============================================================
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Upload documents from Google Drive to Pinecone Assistant"
+    )
+    parser.add_argument(
+        '--sync', action='store_true',
+        help="upload only new/changed files and remove deleted ones (uses sync_manifest.json)"
+    )
+    parser.add_argument(
+        '--pipeline', action=argparse.BooleanOptionalAction, default=True,
+        help="overlap downloads and uploads through a bounded queue (default: on)"
+    )
+    parser.add_argument(
+        '--local-index', action=argparse.BooleanOptionalAction, default=local_index.is_available(),
+        help=f"extract PDF text into a local BM25 index ({LOCAL_INDEX_PATH}) for fast lookups "
+             "and a fallback when the assistant is unavailable (default: on if numpy and pypdf are installed)"
+    )
+    parser.add_argument(
+        '--allow-mass-delete', action='store_true',
+        help="with --sync, allow removing documents even if the Drive folder looks empty or "
+             f"more than {SYNC_MAX_REMOVE_FRACTION:.0%} of the documents would be removed"
+    )
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main execution function"""
+    args = parse_args(argv)
     
     print_header("🚀 AI Chatbot for UNAI - Document Upload")
     
@@ -273,9 +846,13 @@ def main():
     
     print(f"   ✅ Assistant name: {ASSISTANT_NAME}\n")
     
+    if args.local_index and not local_index.is_available():
+        print("⚠️  numpy/pypdf not installed, skipping local index\n")
+        args.local_index = False
+    
     # Authenticate Google Drive
-    drive_service = authenticate_google_drive()
-    if not drive_service:
+    creds = get_google_credentials()
+    if not creds:
         return
     
     # Initialize Pinecone
@@ -283,34 +860,39 @@ def main():
     if not assistant:
         return
     
+    # Incremental sync
+    if args.sync:
+        uploaded = sync_documents(creds, FOLDER_ID, PINECONE_API_KEY, ASSISTANT_NAME,
+                                  args.pipeline, args.local_index, args.allow_mass_delete)
+        if uploaded:
+            wait_for_processing(PINECONE_API_KEY, ASSISTANT_NAME, uploaded)
+        print("Your chatbot is up to date.\n")
+        return
+    
     # Get documents from Google Drive
-    documents = list_documents_in_folder(drive_service, FOLDER_ID)
-    if not documents:
+    files = scan_drive_folder(creds, FOLDER_ID)
+    if not files:
         return
     
-    # Upload documents to Pinecone
-    print_header("📤 Uploading Documents to Pinecone")
+    # Download & upload documents to Pinecone
+    spool = ChunkSpool() if args.local_index else None
+    uploaded = ingest_documents(creds, files, PINECONE_API_KEY, ASSISTANT_NAME,
+                                args.pipeline, spool)
+    success_count = len(uploaded)
     
-    success_count = 0
-    for idx, doc in enumerate(documents, 1):
-        print(f"[{idx}/{len(documents)}] Uploading: {doc['name']}")
-        
-        if upload_to_pinecone(PINECONE_API_KEY, ASSISTANT_NAME, doc):
-            print(f"   ✅ Upload successful\n")
-            success_count += 1
-        else:
-            print()
-        
-        time.sleep(1)  # หน่วงเวลาเล็กน้อยระหว่างการ upload
+    # อัปโหลดทั้ง folder ใหม่ จึงสร้าง local index ใหม่ทั้งหมด
+    if spool is not None:
+        update_local_index(spool, replace=True)
+        spool.close()
     
     print_header(f"✅ Upload Summary")
-    print(f"Total documents: {len(documents)}")
+    print(f"Total documents: {len(files)}")
     print(f"Successfully uploaded: {success_count}")
-    print(f"Failed: {len(documents) - success_count}\n")
+    print(f"Failed: {len(files) - success_count}\n")
     
     # Wait for processing
     if success_count > 0:
-        wait_for_processing(assistant)
+        wait_for_processing(PINECONE_API_KEY, ASSISTANT_NAME, uploaded)
         print_header("🎉 Setup Complete!")
         print("Your chatbot is ready to use!")
         print("Run 'python chat.py' to start asking questions.\n")
@@ -0,0 +1,281 @@
+"""
+AI Chatbot for UNAI - Write-Behind Queue
+บันทึกแชทลง database ใน background thread เพื่อไม่ให้ผู้ใช้ต้องรอ Supabase หลังตอบทุกครั้ง
+- การเปลี่ยนแปลงหลายครั้งของแชทเดียวกันจะถูกรวมเป็นการเขียนครั้งเดียว
+- เขียนเป็น batch และ retry แบบ exponential backoff เมื่อ database ช้า/ล่ม
+- ทุกการเปลี่ยนแปลงถูกเขียนลง journal (JSONL) ก่อน ถ้า process ตายจะถูกเขียนซ้ำตอนเริ่มใหม่
+- journal ถูกล็อกไว้ให้ process เดียว: process อื่นในโฟลเดอร์เดียวกัน (หลาย replica) จะใช้
+  WRITE_JOURNAL.1, .2, ... แทน และ process ที่เริ่มใหม่จะรับช่วงไฟล์ของ process ที่ตายไป
+
+รูปแบบการเปลี่ยนแปลง (change) ของหนึ่งแชท:
+    {"session_id", "user_id", "meta": dict | None, "rewrite": bool, "messages": [...], "delete": bool}
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None    # Windows: ไม่มี flock ใช้ได้ process เดียวต่อ WRITE_JOURNAL
+
+import telemetry
+
+WRITE_JOURNAL = os.getenv('WRITE_JOURNAL', 'write_journal.jsonl')
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '50'))              # แชทต่อหนึ่ง batch
+WRITE_FLUSH_SECONDS = float(os.getenv('WRITE_FLUSH_SECONDS', '0.5'))     # รอรวมการเปลี่ยนแปลง
+WRITE_MAX_RETRIES = int(os.getenv('WRITE_MAX_RETRIES', '8'))
+WRITE_MAX_BACKOFF = float(os.getenv('WRITE_MAX_BACKOFF', '30'))          # วินาที
+JOURNAL_SLOTS = 64    # จำนวน process สูงสุดที่ใช้ WRITE_JOURNAL เดียวกันได้
+
+logger = logging.getLogger("unai.write_behind")
+
+# ============================================================
+# Functions
+# ============================================================
+
+def merge_changes(older: Dict, newer: Dict) -> Dict:
+    """รวมการเปลี่ยนแปลงสองครั้งของแชทเดียวกันให้เหลือครั้งเดียว"""
+    if newer.get("delete"):
+        return {**newer, "meta": None, "rewrite": False, "messages": []}
+    merged = {**older, **newer, "meta": newer.get("meta") or older.get("meta")}
+    if newer.get("rewrite"):
+        merged["messages"] = list(newer["messages"])
+    else:
+        merged["rewrite"] = older.get("rewrite", False)
+        merged["messages"] = older.get("messages", []) + newer.get("messages", [])
+    return merged
+
+# ============================================================
+# Write-Behind Queue
+# ============================================================
+
+class WriteBehindQueue:
+    """
+    รับการเปลี่ยนแปลงแล้วคืนทันที ส่วนการเขียนจริงทำโดย writer(changes) ใน background thread
+    writer ต้องเขียนทั้ง list ให้สำเร็จหรือ raise exception
+    """
+
+    def __init__(self, writer: Callable[[List[Dict]], None], journal_path: str = WRITE_JOURNAL,
+                 batch_size: int = WRITE_BATCH_SIZE, flush_interval: float = WRITE_FLUSH_SECONDS,
+                 max_retries: int = WRITE_MAX_RETRIES):
+        self.writer = writer
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+
+        self._cond = threading.Condition()
+        self._pending = {}       # session_id -> {"change", "seqs", "attempts", "not_before"}
+        self._inflight = {}      # session_id -> item ที่กำลังเขียนอยู่
+        self._seq = 0
+        self._closed = False
+        self._journal = None
+        self.stats = {"submitted": 0, "written": 0, "batches": 0, "retries": 0}
+
+        self._replay_journal()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------- Journal ----------
+
+    def _open_journal(self):
+        """
+        เปิด journal และล็อกไว้จนกว่า process จะจบ
+        ถ้าไฟล์ถูก process อื่นล็อกอยู่ ใช้ไฟล์ถัดไป (.1, .2, ...) ไม่อย่างนั้นจะ truncate/replay ของกันและกัน
+        """
+        base = self.journal_path
+        for slot in range(JOURNAL_SLOTS):
+            path = base if slot == 0 else f"{base}.{slot}"
+            journal = open(path, 'a+', encoding='utf-8')
+            if fcntl is None:
+                break
+            try:
+                fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                journal.close()
+        else:
+            raise RuntimeError(f"All {JOURNAL_SLOTS} write journals {base}[.n] are in use")
+        self.journal_path = path
+        self._journal = journal
+
+    def _replay_journal(self):
+        """โหลดการเปลี่ยนแปลงที่ยังไม่ได้เขียนลง database จาก journal ของรอบก่อน"""
+        self._open_journal()
+        changes, acked = {}, set()
+        self._journal.seek(0)
+        for line in self._journal:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # บรรทัดสุดท้ายอาจเขียนไม่ครบตอน process ตาย
+            if "ack" in record:
+                acked.update(record["ack"])
+            else:
+                changes[record["seq"]] = record["change"]
+
+        unacked = sorted(seq for seq in changes if seq not in acked)
+        if not unacked:
+            self._truncate_journal()
+            return
+
+        logger.warning(f"Replaying {len(unacked)} unsaved change(s) from {self.journal_path}")
+        self._seq = max(changes)
+        for seq in unacked:
+            self._enqueue(changes[seq], [seq], not_before=0)
+
+    def _append_journal(self, record: Dict):
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _truncate_journal(self):
+        """ทุกอย่างถูกเขียนลง database แล้ว เริ่ม journal ใหม่ไม่ให้ไฟล์โตไปเรื่อยๆ"""
+        self._journal.seek(0)
+        self._journal.truncate()
+
+    # ---------- Public API ----------
+
+    def submit(self, change: Dict):
+        """เพิ่มการเปลี่ยนแปลงของหนึ่งแชท (บันทึกลง journal ก่อนคืนค่า)"""
+        with self._cond:
+            self._seq += 1
+            self._append_journal({"seq": self._seq, "change": change})
+            self._enqueue(change, [self._seq])
+            self.stats["submitted"] += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout: float = None, user_id: str = None) -> bool:
+        """
+        ขอให้เขียนการเปลี่ยนแปลงของ user_id (None = ทุกคน) ทันที แล้วรอจนเขียนเสร็จ
+        รายการที่เคยล้มเหลวยังรอตาม backoff เดิม และไม่รอรายการเหล่านั้น
+        คืน False ถ้ายังมีรายการของ user_id ค้างอยู่ (หมดเวลา หรือกำลังรอ retry)
+        """
+        with self._cond:
+            for item in self._pending.values():
+                if not item["attempts"] and self._owned(item, user_id):
+                    item["not_before"] = 0
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: not self._expedited(user_id), timeout)
+            return self._count(user_id) == 0
+
+    def pending_count(self, user_id: str = None) -> int:
+        with self._cond:
+            return self._count(user_id)
+
+    @staticmethod
+    def _owned(item: Dict, user_id: str = None) -> bool:
+        return user_id is None or item["change"].get("user_id") == user_id
+
+    def _count(self, user_id: str = None) -> int:
+        items = list(self._pending.values()) + list(self._inflight.values())
+        return sum(self._owned(item, user_id) for item in items)
+
+    def _expedited(self, user_id: str = None) -> List[Dict]:
+        """รายการของ user_id ที่กำลังเขียน หรือรอเขียนครั้งแรก (ไม่รวมที่กำลังรอ retry)"""
+        return [item for item in self._inflight.values() if self._owned(item, user_id)] + \
+               [item for item in self._pending.values()
+                if not item["attempts"] and self._owned(item, user_id)]
+
+    def close(self, timeout: float = 5.0):
+        """เขียนที่ค้างอยู่ให้หมด (ถ้าเขียนไม่ทัน ข้อมูลยังอยู่ใน journal)"""
+        if self._closed:
+            return
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    # ---------- Worker ----------
+
+    def _enqueue(self, change: Dict, seqs: List[int], attempts: int = 0, not_before: float = None):
+        """ใส่การเปลี่ยนแปลงเข้าคิว ถ้าแชทนี้มีค้างอยู่แล้วจะรวมเป็นรายการเดียว"""
+        if not_before is None:
+            not_before = time.monotonic() + self.flush_interval
+        session_id = change["session_id"]
+        item = self._pending.get(session_id)
+        if item is None:
+            self._pending[session_id] = {
+                "change": change, "seqs": list(seqs), "attempts": attempts, "not_before": not_before
+            }
+            return
+        
+        # batch ที่ล้มเหลว (attempts > 0) เกิดก่อนการเปลี่ยนแปลงที่ค้างอยู่ในคิว
+        older, newer = (change, item["change"]) if attempts else (item["change"], change)
+        item["change"] = merge_changes(older, newer)
+        item["seqs"] = sorted(set(item["seqs"]) | set(seqs))
+        item["attempts"] = max(item["attempts"], attempts)
+        if attempts:
+            item["not_before"] = max(item["not_before"], not_before)
+
+    def _take_batch(self):
+        """
+        เลือกแชทที่ถึงเวลาเขียน คืนค่า (batch, เวลาที่ต้องรอถ้ายังไม่มีแชทไหนพร้อม)
+        แชทที่เคยล้มเหลวจะถูกเขียนแยกทีละแชท เพื่อไม่ให้ข้อมูลที่เสียทำให้แชทอื่นเขียนไม่ได้
+        """
+        if not self._pending:
+            return [], None
+        now = time.monotonic()
+        ready = [sid for sid, item in self._pending.items() if item["not_before"] <= now]
+        if not ready:
+            return [], min(item["not_before"] for item in self._pending.values()) - now
+        retried = [sid for sid in ready if self._pending[sid]["attempts"]]
+        ids = retried[:1] if retried else ready[:self.batch_size]
+        return [(sid, self._pending.pop(sid)) for sid in ids], 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    batch, wait = self._take_batch()
+                    if batch:
+                        break
+                    self._cond.wait(wait)
+                self._inflight.update(batch)
+
+            self._write(batch)
+
+            with self._cond:
+                for session_id, _ in batch:
+                    self._inflight.pop(session_id, None)
+                if not self._pending and not self._inflight:
+                    self._truncate_journal()
+                self._cond.notify_all()
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        try:
+            self.writer([item["change"] for _, item in batch])
+        except Exception as e:
+            telemetry.record("db.write_behind.flush", (time.perf_counter() - start) * 1000,
+                             "error", batch=len(batch))
+            self._retry(batch, e)
+            return
+
+        telemetry.record("db.write_behind.flush", (time.perf_counter() - start) * 1000,
+                         "ok", batch=len(batch))
+        with self._cond:
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+            self._append_journal({"ack": [seq for _, item in batch for seq in item["seqs"]]})
+
+    def _retry(self, batch, error):
+        """ใส่คืนคิวพร้อม backoff ไม่ทิ้งข้อมูล (retry ต่อไปเรื่อยๆ ที่ช่วงห่างสูงสุด)"""
+        with self._cond:
+            for session_id, item in batch:
+                attempts = item["attempts"] + 1
+                if attempts > self.max_retries:
+                    logger.error(f"Session {session_id} still failing after {attempts - 1} retries: {error}")
+                delay = min(WRITE_MAX_BACKOFF, 0.5 * 2 ** (attempts - 1))
+                self.stats["retries"] += 1
+                self._enqueue(item["change"], item["seqs"], attempts, time.monotonic() + delay)
+            logger.warning(f"Write-behind flush of {len(batch)} session(s) failed: {error}")